@@ -0,0 +1,54 @@
+"""
+Generate logbooks that look like ones worked with for years, to benchmark rata on.
+
+    python -m benchmarks.logbook <file name> [--tasks 50] [--records 200] [--fragmentation 0.5]
+"""
+import argparse
+from datetime import datetime, timedelta
+import random
+
+from rata.libs.io import write_file
+
+
+def generate(file_name, tasks=50, records=200, fragmentation=0.5, running=True, seed=0):
+    """
+    Write a logbook of `tasks` tasks with `records` records each, one after the other on working days. fragmentation is
+    the chance that the next record belongs to another task than the one before: 0 means each task is worked on in one
+    stretch, 1 means switching tasks with every record. Fragmented records are shorter. With running=True the very last
+    record is still running. Returns the tasks as written, a dict of task name -> list of [start, end].
+    """
+    generator = random.Random(seed)
+    names = ["Task {}".format(i) for i in range(tasks)]
+    remaining = {name: records for name in names}
+    written = {name: [] for name in names}
+    moment = datetime(2015, 1, 5, 8, 0, 0)
+    task = names[0] if names else None
+    for _ in range(tasks * records):
+        if remaining[task] == 0 or generator.random() < fragmentation:
+            task = generator.choice([name for name in names if remaining[name]])
+        remaining[task] -= 1
+        longest = int(240 - 200 * fragmentation)
+        end = moment + timedelta(minutes=generator.randint(5, longest), seconds=generator.randint(0, 59))
+        written[task].append([moment, end])
+        moment = end + timedelta(minutes=generator.randint(1, 30))
+        if moment.hour >= 17:  # Next working day
+            moment = (moment + timedelta(days=3 if moment.weekday() == 4 else 1)).replace(hour=8, minute=0)
+    if running and task is not None:
+        written[task][-1][1] = None
+    write_file(written, file_name)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.logbook", description="Write a generated logbook.")
+    parser.add_argument("file")
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--records", type=int, default=200, help="records per task")
+    parser.add_argument("--fragmentation", type=float, default=0.5, help="chance to switch tasks, 0 to 1")
+    parser.add_argument("--stopped", action="store_true", help="don't leave the last record running")
+    options = parser.parse_args()
+    generate(options.file, options.tasks, options.records, options.fragmentation, not options.stopped)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Compare the fixed-width CLOCK line parser with the generic strptime based fallback on a generated logbook.
+
+    python -m benchmarks.parse [number of lines]
+"""
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import time
+
+from rata.libs import io
+from rata.libs.io import format_record
+
+
+def generate(file_name, lines):
+    start = datetime(2015, 1, 1, 8, 0, 0)
+    with open(file_name, "w") as output_file:
+        for task in range(lines // 1000 + 1):
+            output_file.write("* Task {}\n:LOGBOOK:\n".format(task))
+            for _ in range(min(lines, 1000)):
+                end = start + timedelta(minutes=47, seconds=13)
+                output_file.write("CLOCK: {}\n".format(format_record(start, end)))
+                start = end + timedelta(minutes=5)
+            lines -= 1000
+            output_file.write(":END:\n")
+
+
+def timed(function, *args):
+    began = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - began
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "logbook.txt")
+        generate(file_name, lines)
+        fast = timed(io.read_file, file_name)
+        parse_line = io.parse_line
+        io.parse_line = io._parse_any_width
+        try:
+            slow = timed(io.read_file, file_name)
+        finally:
+            io.parse_line = parse_line
+    print("read_file on {} lines: {:.3f}s with strptime, {:.3f}s fixed-width, {:.1f}x faster".format(
+        lines, slow, fast, slow / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Time how long rata takes as a new process: starting the UI, showing the task list and quitting, and the commands
+answered without the UI, `rata status`, `rata start <task>` and `rata stop`, with no daemon running. Prints JSON like
+the suite.
+
+    python -m benchmarks.startup [--tasks 50] [--records 200] [--repeat 5] [--output file]
+"""
+import argparse
+import fcntl
+import json
+import os
+import platform
+import pty
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+
+from .logbook import generate
+from .suite import _git, _revision, measure, screen_size
+
+python = [sys.executable, "-m", "rata"]
+
+
+def _run(*args):
+    subprocess.run(python + list(args), check=True, stdout=subprocess.DEVNULL)
+
+
+def _show_ui(file_name):
+    """Start the UI in a terminal, wait until it shows the first of the generated tasks and quit it again."""
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execv(sys.executable, python + [file_name])
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", screen_size[1], screen_size[0], 0, 0))
+    output = b""
+    try:
+        while b"Task 0 " not in output:
+            if select.select([fd], [], [], 10)[0] == []:
+                raise RuntimeError("The UI didn't show up within 10 seconds")
+            try:
+                output += os.read(fd, 65536)
+            except OSError:  # Exited
+                raise RuntimeError("The UI didn't start:\n{}".format(output.decode(errors="replace")))
+    finally:
+        os.write(fd, b"q")
+        os.waitpid(pid, 0)
+        os.close(fd)
+
+
+def scenarios(file_name, repeat):
+    """Yield (name, timings) of every scenario. file_name must be a generated logbook committed to git."""
+    yield "python", measure(lambda: subprocess.run([sys.executable, "-c", "pass"], check=True), repeat)
+    yield "ui", measure(lambda: _show_ui(file_name), repeat)
+    _run("status", "--file", file_name)  # Fill the summary
+    yield "status", measure(lambda: _run("status", "--file", file_name), repeat)
+    summaries = [os.path.join(os.environ["RATA_CACHE_DIR"], f) for f in os.listdir(os.environ["RATA_CACHE_DIR"])
+                 if f.endswith(".json")]
+    yield "status without summary", measure(lambda: _run("status", "--file", file_name), repeat,
+                                            setup=lambda: [os.unlink(f) for f in summaries if os.path.exists(f)])
+    yield "start", measure(lambda: _run("start", "Task 0", "--file", file_name), repeat,
+                           setup=lambda: _run("stop", "--file", file_name) if _is_running(file_name) else None)
+    yield "stop", measure(lambda: _run("stop", "--file", file_name), repeat,
+                          setup=lambda: _run("switch", "Task 0", "--file", file_name))
+
+
+def _is_running(file_name):
+    process = subprocess.run(python + ["status", "--file", file_name, "--json"], check=True, stdout=subprocess.PIPE)
+    return json.loads(process.stdout)["running"] is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="Benchmark starting rata.")
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--records", type=int, default=200, help="records per task")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    options = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["RATA_CACHE_DIR"] = os.path.join(directory, ".cache")
+        os.environ["RATA_SOCKET"] = os.path.join(directory, "no-daemon.sock")
+        os.environ["TERM"] = "xterm"
+        _git(directory, "init", "-q")
+        _git(directory, "config", "user.name", "rata benchmark")
+        _git(directory, "config", "user.email", "benchmark@localhost")
+        file_name = os.path.join(directory, "logbook.txt")
+        generate(file_name, options.tasks, options.records, running=False)  # Quitting the UI then changes nothing
+        _git(directory, "add", "logbook.txt")
+        _git(directory, "commit", "-q", "-m", "Generated logbook")
+        results = dict(scenarios(file_name, options.repeat))
+    json.dump({
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "parameters": {"tasks": options.tasks, "records": options.records, "repeat": options.repeat},
+        "results": results,
+    }, options.output, indent=2)
+    options.output.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Time the paths rata goes through most on a generated logbook in a temporary git repository. Prints JSON so results of
+different versions can be compared.
+
+    python -m benchmarks.suite [--tasks 50] [--records 200] [--fragmentation 0.5] [--repeat 5] [--output file]
+"""
+import argparse
+from datetime import timedelta
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import urwid
+
+from rata.libs import io
+from rata.libs.tasks import TaskManager
+from rata.libs.widgets import TaskWalker
+
+from .logbook import generate
+
+screen_size = (160, 40)
+
+
+def measure(function, repeat, setup=None):
+    """Run function `repeat` times, calling setup untimed before each run. Returns seconds per run."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        began = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - began)
+    return {"runs": repeat, "min": min(times), "median": statistics.median(times), "max": max(times)}
+
+
+def _git(directory, *args):
+    subprocess.run(["git"] + list(args), cwd=directory, check=True, stdout=subprocess.DEVNULL)
+
+
+def _revision():
+    """Commit of the rata source tree the benchmark runs on, if it is a git checkout."""
+    process = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return process.stdout.decode().strip() if process.returncode == 0 else None
+
+
+def scenarios(file_name, repeat):
+    """Yield (name, timings) of every scenario. file_name must be a generated logbook committed to git."""
+    tasks = io.read_file(file_name)
+    yield "read_file", measure(lambda: io.read_file(file_name), repeat)
+    copy_name = file_name + ".copy"
+    yield "write_file", measure(lambda: io.write_file(tasks, copy_name), repeat,
+                                setup=lambda: os.path.exists(copy_name) and os.unlink(copy_name))
+    yield "write_file unchanged", measure(lambda: io.write_file(tasks, file_name), repeat)
+
+    os.environ["RATA_CACHE_DIR"] = ""
+    yield "load", measure(lambda: TaskManager(file_name).close(), repeat)
+    os.environ["RATA_CACHE_DIR"] = os.path.join(os.path.dirname(file_name), ".cache")
+    TaskManager(file_name).close()  # Fill the cache
+    yield "load cached", measure(lambda: TaskManager(file_name).close(), repeat)
+    yield "load lazy", measure(lambda: TaskManager(file_name, lazy=True).close(), repeat)
+
+    taskmanager = TaskManager(file_name)
+    try:
+        yield "check_for_overlapping", measure(taskmanager.check_for_overlapping, repeat)
+        for sort_order in ("name", "duration", "most recent"):
+            yield "sort by {}".format(sort_order), measure(lambda: taskmanager.tasks_by(sort_order), repeat)
+        yield "durations", measure(lambda: (taskmanager.total_duration, taskmanager.todays_duration), repeat)
+
+        running = taskmanager.find_running_task()
+        yield "refresh tick", measure(_refresh_tick(taskmanager, running), repeat)
+        running.stop()
+
+        # Quick-edit of the record before the last one, moving its start back and forth by a minute
+        nudged = sorted(running.records, key=lambda r: r.start)[-2]
+        directions = iter([timedelta(minutes=1), timedelta(minutes=-1)] * repeat)
+        yield "nudge", measure(lambda: _nudge(nudged, next(directions)), repeat)
+
+        task = taskmanager.tasks_by("name")[0]
+        yield "start/stop", measure(lambda: (task.start(), task.stop()), repeat)
+        yield "commit", measure(taskmanager.committer.flush, repeat, setup=lambda: (task.start(), task.stop()))
+    finally:
+        taskmanager.close()
+
+
+def _refresh_tick(taskmanager, task):
+    """What a tick of the clock does on the main screen: redraw the running task's row and the title."""
+    walker = TaskWalker([urwid.Text("")], [urwid.Text("")], lambda button, task: None)
+    walker.set_tasks(taskmanager.tasks_by("name"), task)
+    listbox = urwid.ListBox(walker)
+    walker.set_focus(walker.positions[task] + 1)
+    listbox.render(screen_size, focus=True)
+
+    def tick():
+        walker.update(task)
+        io.format_duration(taskmanager.total_duration)
+        io.format_duration(taskmanager.todays_duration)
+        listbox.render(screen_size, focus=True)
+    return tick
+
+
+def _nudge(record, delta):
+    old_start, old_end = record.start, record.end
+    record.start += delta
+    record.task.taskmanager.check_for_overlapping(record)
+    record.save(old_start, old_end)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description="Benchmark rata, print JSON.")
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--records", type=int, default=200, help="records per task")
+    parser.add_argument("--fragmentation", type=float, default=0.5, help="chance to switch tasks, 0 to 1")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    options = parser.parse_args()
+    os.environ["RATA_COMMIT_DELAY"] = "3600"  # Commits are only timed in the commit scenario
+    with tempfile.TemporaryDirectory() as directory:
+        _git(directory, "init", "-q")
+        _git(directory, "config", "user.name", "rata benchmark")
+        _git(directory, "config", "user.email", "benchmark@localhost")
+        file_name = os.path.join(directory, "logbook.txt")
+        generate(file_name, options.tasks, options.records, options.fragmentation)
+        _git(directory, "add", "logbook.txt")
+        _git(directory, "commit", "-q", "-m", "Generated logbook")
+        results = dict(scenarios(file_name, options.repeat))
+    json.dump({
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "parameters": {"tasks": options.tasks, "records": options.records, "fragmentation": options.fragmentation,
+                       "repeat": options.repeat},
+        "results": results,
+    }, options.output, indent=2)
+    options.output.write("\n")
+
+
+if __name__ == '__main__':
+    main()
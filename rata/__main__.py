@@ -1,21 +1,53 @@
+import os
 import sys
 
-from .libs.application import Rata
-from .libs.io import is_inside_git_dir
+# Modules are imported only by the command needing them, so e.g. `rata status` in a shell prompt doesn't pay for urwid.
+fast_commands = ["status", "start", "stop", "switch"]
 
 
 def main():
-    try:
-        file_name = sys.argv[1]
-    except IndexError:
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in fast_commands:
+        from .libs import client
+        return client.main(command, sys.argv[2:])
+    from .libs import profiling
+    profiling.start()
+    if command == "report":
+        from .libs import report
+        return report.main(sys.argv[2:])
+    if command == "import":
+        from .libs import bulk
+        return bulk.main(sys.argv[2:])
+    if command == "archive":
+        from .libs import archive
+        return archive.main(sys.argv[2:])
+    if command == "daemon":
+        from .libs import daemon
+        return daemon.main(sys.argv[2:])
+    if command is None:
         print("File name argument missing. Start rata with a path like 'rata timerecords.txt'")
         sys.exit()
+    file_name = command
 
+    from .libs.io import expand_paths, is_inside_git_dir
     if not is_inside_git_dir(file_name):
         print("No git directory. rata expects the given file name to be git-versioned to commit changes.")
         sys.exit()
 
-    Rata(file_name)
+    if os.path.isdir(file_name) and not expand_paths([file_name]):
+        print("No rata files in {}. Create one first, e.g. with 'rata {}'".format(
+            file_name, os.path.join(file_name, "timerecords.txt")))
+        sys.exit()
+
+    from .libs import client
+    from .libs.application import Rata
+    from .libs.exceptions import ParseError
+    with client.handed_over(file_name):
+        try:
+            Rata(file_name)
+        except ParseError as e:
+            print(e)
+            sys.exit(1)
 
 
 if __name__ == '__main__':
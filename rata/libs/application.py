@@ -3,13 +3,19 @@ from itertools import cycle
 
 import urwid
 
-from .edit_tasks import make_edit_task_screen
+from .browse_history import make_history_screen
+from .edit_tasks import bulk_edit, make_edit_task_screen
+from .exceptions import ParseError, RecordOverlap
+from . import profiling
+from .history import History
 from .io import format_duration
-from .tasks import TaskManager
-from .widgets import NewTask, TaskButtonWrap, RenameTask
+from .rollup import periods
+from .workspace import Workspace
+from .widgets import NewTask, RenameTask, TaskWalker
 
 
 order_modes = cycle(["duration", "most recent", "name"])
+period_modes = cycle(periods[1:] + periods[:1])
 palette = [
     ('active-bg', 'default', 'dark gray'),
     ('standout-fg', 'standout', 'default'),
@@ -17,97 +23,159 @@ palette = [
     ('red', 'dark red', ''),
 ]
 refresh_interval = 1
-help_line = " | ".join(["Enter: start/stop task", "Right: edit", "(n)ew task", "(s)tart/stop last task", "s(o)rt tasks",
-                        "(r)ename task", "(q)uit"])
+watch_interval = 2  # Seconds between checks whether someone else changed the files
+help_items = ["Enter: start/stop task", "Right: edit", "(n)ew task", "(s)tart/stop last task", "s(o)rt tasks",
+              "(r)ename task", "(p)eriod", "(h)istory", "(q)uit"]
 
 
 class Rata(object):
     sort_order = "name"
+    period = periods[0]
     message_box = urwid.AttrMap(urwid.Text(""), "red")
     view = "main"
+    refresh_alarm = None
+    edited_task = None  # Task shown on the edit screen
 
     def __init__(self, file_name):
-        self.file_name = file_name
-        self.taskmanager = TaskManager(file_name)
-        self.current_task = self.taskmanager.find_running_task()
-        self.body = self.create_tasks_menu()
+        """Open a single file or, given a folder, all files in it. The task list shows one file at a time."""
+        self.workspace = Workspace([file_name], lazy=bool(os.getenv("RATA_LAZY")))
+        self.taskmanager = self.workspace.taskmanagers[0]
+        self.current_task = self.workspace.find_running_task()
+        self.histories = {}  # file name -> History, kept to reuse parsed versions
+        self.title_text = urwid.Text(self.title)
+        self.tasks_menu = self.create_tasks_menu()
+        self.body = urwid.Padding(self.tasks_menu, left=0, right=0)
         self.loop = urwid.MainLoop(
             self.body,
             palette,
             unhandled_input=self.handle_input
         )
-        self.loop.set_alarm_in(refresh_interval, self.refresh)
-        self.loop.run()
+        self.loop.draw_screen = profiling.timed("draw_screen")(self.loop.draw_screen)
+        self.to_main_screen()
+        self.loop.set_alarm_in(watch_interval, self.watch)
+        try:
+            self.loop.run()
+        finally:
+            self.workspace.close()
+            for history in self.histories.values():
+                history.close()
 
+    @profiling.timed("refresh")
     def refresh(self, loop, data):
         """Update clocks on the screen: current task duration & total task duration."""
+        self.refresh_alarm = None
         if self.view == "main":  # Don't do anything if not on main screen as widgets are different
             if self.current_task:
-                self.current_task.button.base_widget.set_label(self.current_task.label)
+                self.task_walker.update(self.current_task)
                 self.set_message("{}: {}".format(self.current_task.name,
                                                  self.current_task.running_record.label_with_duration))
             else:
                 self.set_message("")
-            if hasattr(self.body.base_widget, "body"):
-                self.body.base_widget.body[0].set_text(self.title)
-        loop.set_alarm_in(refresh_interval, self.refresh)
+            self.set_title()
+        self.schedule_refresh()
+
+    def watch(self, loop, data):
+        """Show changes others made to the files, e.g. by editing them or pulling them from another machine."""
+        self.loop.set_alarm_in(watch_interval, self.watch)
+        if self.view != "main":  # Records may be edited right now, the changes are picked up later
+            return
+        changed = False
+        error = None
+        for taskmanager in self.workspace.taskmanagers:
+            try:
+                changed = taskmanager.reload() or changed
+            except (ParseError, RecordOverlap) as e:
+                changed = True
+                error = "Changed by someone else: {}".format(e)
+        if changed:
+            self.current_task = self.workspace.find_running_task()
+            self.to_main_screen()
+        if error:
+            self.set_message(error, error=True)
+
+    def schedule_refresh(self):
+        """Tick every second while something changes on its own: a running task or commits still pending."""
+        if self.refresh_alarm is None and (self.current_task or self.workspace.committer.pending):
+            self.refresh_alarm = self.loop.set_alarm_in(refresh_interval, self.refresh)
 
+    @profiling.timed("to_main_screen")
     def to_main_screen(self):
-        """Replace what is on the screen and show the main screen again"""
-        focus = None
-        if self.view == "main":
-            focus = self.body.original_widget.base_widget.get_focus()[0].base_widget
+        """Replace what is on the screen and show the main screen again, with the cursor on the same task as before"""
         self.view = "main"
         self.set_message("")
-        self.body.original_widget = self.create_tasks_menu()
-        # Move cursor to where it was before:
-        if focus:
-            for index, w in enumerate(self.body.original_widget.base_widget.body):
-                if hasattr(w.base_widget, "button") and w.base_widget.task == focus.task:
-                    self.body.original_widget.base_widget.set_focus(index)
+        self.set_title()
+        self.task_walker.set_tasks(self.taskmanager.tasks_by(self.sort_order), self.current_task)
+        self.body.original_widget = self.tasks_menu
+        self.schedule_refresh()
+
+    def set_title(self):
+        """Set title, only repainting it if it changed."""
+        title = self.title
+        if title != self.title_text.text:
+            self.title_text.set_text(title)
 
     def set_message(self, message, error=False):
         if error:
-            self.message_box.set_attr_map({None: 'red'})
+            attr = 'red'
         elif message:
-            self.message_box.set_attr_map({None: 'standout-fg'})
+            attr = 'standout-fg'
         else:
-            self.message_box.set_attr_map({None: 'normal'})
-        self.message_box.base_widget.set_text(message)
+            attr = 'normal'
+        if self.message_box.get_attr_map() != {None: attr}:
+            self.message_box.set_attr_map({None: attr})
+        if self.message_box.base_widget.text != message:
+            self.message_box.base_widget.set_text(message)
 
     @property
     def title(self):
         """Defines top line shown above the task table."""
         rate = os.getenv("RATE")
         total_duration = self.taskmanager.total_duration
-        todays_duration = self.taskmanager.todays_duration
+        period_duration = self.taskmanager.period_duration(self.period)
         total_earned = ""
-        today_earned = ""
+        period_earned = ""
         if rate:
             total_earned = " | {:.2f} €".format(total_duration.total_seconds()/3600 * float(rate))
-            today_earned = " | {:.2f} €".format(todays_duration.total_seconds()/3600 * float(rate))
-        title = "Tasks {} - sorted by {} - Total {}{} - Today {}{}".format(
-            self.file_name, self.sort_order, format_duration(total_duration), total_earned,
-            format_duration(todays_duration), today_earned)
-        return title
+            period_earned = " | {:.2f} €".format(period_duration.total_seconds()/3600 * float(rate))
+        # Archived records only count towards the total, see TaskManager.period_duration
+        archive_note = " without archive" if self.taskmanager.archived_seconds else ""
+        title = "Tasks {} - sorted by {} - Total {}{} - {}{} {}{}".format(
+            self.taskmanager.file_name, self.sort_order, format_duration(total_duration), total_earned,
+            self.period.capitalize(), archive_note, format_duration(period_duration), period_earned)
+        if len(self.workspace.taskmanagers) > 1:
+            title += " - All files {} / {} {}".format(format_duration(self.workspace.total_duration), self.period,
+                                                     format_duration(self.workspace.period_duration(self.period)))
+        return title + self.commit_status
+
+    @property
+    def commit_status(self):
+        """Shows changes written to the file but not committed to git yet."""
+        pending = self.workspace.committer.pending
+        failed = self.workspace.committer.failed
+        status = ""
+        if pending:
+            status += " - {} pending".format(pending)
+        if failed:
+            status += " - {} failed to commit".format(failed)
+        return status
+
+    @property
+    def help_line(self):
+        items = help_items[:]
+        if len(self.workspace.taskmanagers) > 1:
+            items.insert(-1, "next (f)ile")
+        return " | ".join(items)
 
+    @profiling.timed("create_tasks_menu")
     def create_tasks_menu(self):
         """Renders title and bottom line and in the middle a scrollable table of tasks with their duration"""
-        body = [urwid.Text(self.title), urwid.Divider()]
-        for task in self.taskmanager.tasks_by(self.sort_order):
-            button = TaskButtonWrap(task)
-            urwid.connect_signal(button.button, "click", self.toggle_recording_task, task)
-            if task == self.current_task:
-                button = urwid.AttrMap(button, "standout-fg")
-            else:
-                button = urwid.AttrMap(button, "normal", "active-bg")
-            task.button = button
-            body.append(button)
-        body += [urwid.Divider(),
-                 self.message_box,
-                 urwid.Divider(),
-                 urwid.Text(help_line)]
-        return urwid.Padding(urwid.ListBox(urwid.SimpleFocusListWalker(body)), left=0, right=0)
+        header = [self.title_text, urwid.Divider()]
+        footer = [urwid.Divider(),
+                  self.message_box,
+                  urwid.Divider(),
+                  urwid.Text(self.help_line)]
+        self.task_walker = TaskWalker(header, footer, self.toggle_recording_task)
+        return urwid.ListBox(self.task_walker)
 
     def toggle_recording_task(self, button, task):
         """Event handler for Enter-key on a task line: start/stop recording"""
@@ -135,9 +203,25 @@ class Rata(object):
             elif key == 'o':  # sort
                 self._sort()
                 return
+            elif key == 'p':  # period summed up in the title
+                self.period = next(period_modes)
+                self.set_title()
+                return
             elif key == 'right':  # edit
                 self._edit_task()
                 return
+            elif key == 'h':  # browse commits
+                self.body.original_widget = make_history_screen(self)
+                return
+            elif key == 'f':  # show tasks of the next file of a workspace
+                self._next_file()
+                return
+            elif key == 'P' and profiling.enabled:  # debug overlay with timings, not in the help line
+                self._show_profile()
+                return
+        elif self.view == "edit" and key in ("S", "M", "x", "t"):  # change many records at once
+            bulk_edit(self, key)
+            return
         if key == 'q':  # quit
             self._quit()
             return
@@ -157,10 +241,8 @@ class Rata(object):
             self.current_task.stop()
             self.current_task = None
         else:
-            tasks = self.taskmanager.tasks[:]
-            tasks.sort(key=lambda t: t.most_recent, reverse=True)
-            self.current_task = tasks[0]
-            tasks[0].start()
+            self.current_task = self.taskmanager.tasks_by("most recent")[0]
+            self.current_task.start()
         self.to_main_screen()  # Will resort
 
     def _rename_task(self):
@@ -182,11 +264,30 @@ class Rata(object):
         self.sort_order = next(order_modes)
         self.to_main_screen()  # Will resort
 
+    def _next_file(self):
+        taskmanagers = self.workspace.taskmanagers
+        self.taskmanager = taskmanagers[(taskmanagers.index(self.taskmanager) + 1) % len(taskmanagers)]
+        self.to_main_screen()
+
+    def _show_profile(self):
+        self.view = "profile"
+        text = urwid.Text(profiling.format_summary() + "\n\nEsc: back")
+        box = urwid.LineBox(urwid.Filler(text, valign="top"), title="Timings")
+        self.body.original_widget = urwid.Overlay(box, self.tasks_menu, "center", ("relative", 80), "middle",
+                                                  ("relative", 80))
+
     def _edit_task(self):
         if not self.taskmanager.tasks:
             return
         self.body.original_widget = make_edit_task_screen(self)
 
+    def history(self):
+        """History of the file shown."""
+        file_name = self.taskmanager.file_name
+        if file_name not in self.histories:
+            self.histories[file_name] = History(file_name)
+        return self.histories[file_name]
+
     def add_new_task(self, name):
         """Event handler for when a new task name was entered: Adds and starts tracking it."""
         task = self.taskmanager.add(name)
@@ -0,0 +1,102 @@
+"""
+`rata archive`: moves the records of closed periods out of a file into archive files, one per month in a folder next
+to it, e.g. projectFoo.txt.archive/2020-12.txt. The file keeps an `ARCHIVED:` line per task with the seconds moved, so
+totals stay the same while loading, sorting, overlap checks, rewriting and diffing the file only deal with recent
+records. Archive files are rata files themselves, `rata report` reads them along with the file.
+"""
+import argparse
+from datetime import date, datetime, time
+import os
+import sys
+
+from . import client
+from .exceptions import ParseError
+from .io import compact, expand_paths, git_commit, is_inside_git_dir, no_git_directory, read_file, write_file
+
+
+def archive_folder(file_name):
+    return file_name + ".archive"
+
+
+def archive_names(file_name):
+    """Archive files of a file, oldest first."""
+    folder = archive_folder(file_name)
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    return [os.path.join(folder, name) for name in sorted(names) if name.endswith(".txt") and not name.startswith(".")]
+
+
+def default_cutoff(today=None):
+    """First day of the month $RATA_KEEP_MONTHS months before the current one, by default the previous month."""
+    today = today or date.today()
+    month = today.year * 12 + today.month - 1 - int(os.getenv("RATA_KEEP_MONTHS", "1"))
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def archive(file_name, before):
+    """
+    Move the stopped records of a file ending before the given day to its archive files, adding their seconds to the
+    archived total of their task. Running records and those crossing the cutoff stay. Returns the number of records
+    moved and the names of the archive files written.
+    """
+    cutoff = datetime.combine(before, time())
+    compact(file_name)  # So the journal isn't replayed on top of the file without the moved records
+    tasks = read_file(file_name)
+    periods = {}  # Month -> task name -> records moved
+    count = 0
+    for name, records in tasks.items():
+        kept = []
+        for start, end in records:
+            if end is None or end > cutoff:
+                kept.append([start, end])
+                continue
+            periods.setdefault(start.strftime("%Y-%m"), {}).setdefault(name, []).append([start, end])
+            tasks.archived[name] = tasks.archived.get(name, 0) + int((end - start).total_seconds())
+            count += 1
+        records[:] = kept
+    if not count:
+        return 0, []
+    os.makedirs(archive_folder(file_name), exist_ok=True)
+    written = []
+    for period, moved in sorted(periods.items()):  # Archive files first, a crash in between then only duplicates
+        archive_name = os.path.join(archive_folder(file_name), "{}.txt".format(period))
+        archived = read_file(archive_name) if os.path.exists(archive_name) else {}
+        for name, records in moved.items():
+            known = archived.setdefault(name, [])
+            known += [r for r in records if r not in known]  # Already there if archiving was interrupted before
+        write_file(archived, archive_name)
+        written.append(archive_name)
+    write_file(tasks, file_name)
+    if not git_commit(file_name, "Archive records before {}".format(before), *written):
+        print("Could not commit {} and its archive files, git add and commit them yourself".format(file_name),
+              file=sys.stderr)
+    return count, written
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="rata archive", description="Move the records of closed periods to one "
+                                     "archive file per month next to the file, which keeps the total per task.")
+    parser.add_argument("files", nargs="+", help="rata files or folders of rata files")
+    parser.add_argument("--before", type=date.fromisoformat, help="move records ending before this day, as "
+                        "YYYY-MM-DD. Defaults to the first day of the previous month, or of $RATA_KEEP_MONTHS before")
+    options = parser.parse_args(args)
+    try:
+        before = options.before or default_cutoff()
+    except ValueError as e:
+        print("RATA_KEEP_MONTHS must be a number of months: {}".format(e), file=sys.stderr)
+        return 1
+    for file_name in expand_paths(options.files):
+        if not is_inside_git_dir(file_name):
+            print(no_git_directory.format(file_name), file=sys.stderr)
+            return 1
+        try:
+            with client.handed_over(file_name):
+                count, written = archive(file_name, before)
+        except (ParseError, OSError) as e:
+            print(e, file=sys.stderr)
+            return 1
+        print("Moved {} records of {} before {} to {} archive files in {}".format(
+            count, file_name, before, len(written), archive_folder(file_name)))
+    return 0
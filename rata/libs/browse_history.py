@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import urwid
+
+from .exceptions import ParseError
+from .io import datetime_format, format_duration
+
+
+def make_history_screen(application):
+    """List the commits of the file shown. Picking two of them shows how the time per task differs between them."""
+    application.view = "history"
+    history = application.history()
+    history.update()
+    picked = []
+    body = [urwid.Text("History of {}".format(history.file_name)), urwid.Divider()]
+    for commit in history.commits:
+        button = urwid.Button("{}  {}".format(datetime.fromtimestamp(commit[1]).strftime(datetime_format), commit[2]))
+        row = urwid.AttrMap(button, "normal", "active-bg")
+        urwid.connect_signal(button, 'click', _pick, (application, history, commit, row, picked))
+        body.append(row)
+    if not history.commits:
+        body.append(urwid.Text("No commits yet"))
+    body += [urwid.Divider(),
+             urwid.Text("Enter: pick two commits to compare, the same one twice to compare it with the one before | "
+                        "Esc: back"),
+             urwid.Divider(),
+             application.message_box]
+    application.set_message("")
+    return urwid.Padding(urwid.ListBox(urwid.SimpleFocusListWalker(body)), left=0, right=0)
+
+
+def _pick(button, data):
+    application, history, commit, row, picked = data
+    if not picked:
+        picked.append(commit)
+        row.set_attr_map({None: "standout-fg"})
+        application.set_message("Pick the commit to compare with")
+        return
+    other = picked.pop()
+    if other == commit:
+        other = history.previous(commit) or (None, 0, "", None)  # Compare the first commit with an empty file
+    old, new = sorted([other, commit], key=lambda c: c[1])
+    try:
+        differences = history.diff(old, new)
+    except ParseError as e:
+        application.set_message(str(e), error=True)
+        return
+    application.body.original_widget = _make_diff_screen(old, new, differences)
+
+
+def _make_diff_screen(old, new, differences):
+    def label(commit):
+        if commit[0] is None:
+            return "the start"
+        return "{} ({})".format(datetime.fromtimestamp(commit[1]).strftime(datetime_format), commit[0][:8])
+
+    body = [urwid.Text("Tracked time per task from {} to {}".format(label(old), label(new))), urwid.Divider()]
+    for task, before, after in differences:
+        change = after - before
+        body.append(urwid.Text("{:40.40s} {:>20} -> {:>20}  {}{}".format(
+            task, format_duration(timedelta(seconds=before)), format_duration(timedelta(seconds=after)),
+            "+" if change > 0 else "-", format_duration(timedelta(seconds=abs(change))))))
+    if not differences:
+        body.append(urwid.Text("No differences"))
+    body += [urwid.Divider(), urwid.Text("Esc: back")]
+    return urwid.ListBox(urwid.SimpleFocusListWalker(body))
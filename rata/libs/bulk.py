@@ -0,0 +1,241 @@
+"""
+Changing many records at once, e.g. to fix a day's worth of records or to import old timesheets. A Batch applies all
+changes first and only then checks the changed records for overlaps, in one pass over the overlap index. The changes are
+written to the journal as a single event and end up in a single commit, or are all undone if any record overlaps.
+"""
+import argparse
+import csv
+from datetime import datetime
+import os
+import re
+import sys
+
+from . import client
+from .exceptions import ParseError, RecordOverlap
+from .io import is_inside_git_dir, no_git_directory, parse_timestamp
+from .records import RUNNING, from_epoch, to_epoch
+from .tasks import Record, TaskManager
+
+
+class Batch(object):
+    """Changes to records of a single file, applied right away and written by commit() or undone by rollback()."""
+
+    def __init__(self, taskmanager):
+        self.taskmanager = taskmanager
+        self.events = []  # Journal events of the changes so far
+        self._undo = []  # Functions reverting the changes, in the order they were made
+        self._changed = set()  # Rows of records added or changed, to check for overlaps
+        self.count = 0  # Records added or changed
+
+    def shift(self, records, delta):
+        """Move records by a timedelta. Running records keep running, only their start moves."""
+        now = to_epoch(datetime.now())
+        seconds = int(delta.total_seconds())
+        for record in records:
+            start, end = self._row(record)
+            if end == RUNNING and start + seconds > now:
+                raise ValueError("A running record can't start in the future")
+            self._set(record, start + seconds, end if end == RUNNING else end + seconds)
+
+    def merge(self, records):
+        """Replace records of one task by a single one from the earliest start to the latest end."""
+        records = sorted(records, key=lambda r: self.taskmanager.store.starts[r.id])
+        if len(records) < 2:
+            raise ValueError("Select at least two records to merge")
+        if len({r.task for r in records}) > 1:
+            raise ValueError("Only records of the same task can be merged")
+        ends = [self._row(r)[1] for r in records]
+        first = records[0]
+        self._set(first, self._row(first)[0], RUNNING if RUNNING in ends else max(ends))
+        for record in records[1:]:
+            self._delete(record)
+
+    def split(self, record, moment):
+        """Cut a record into two at the given datetime."""
+        start, end = self._row(record)
+        at = to_epoch(moment)
+        if not start < at < (to_epoch(datetime.now()) if end == RUNNING else end):
+            raise ValueError("Split at a moment between start and end of the record")
+        self._set(record, start, at)
+        self._insert(record.task, at, end)
+
+    def move(self, records, task):
+        """Hand records over to another task of the same file."""
+        if task.taskmanager is not self.taskmanager:
+            raise ValueError("Records can only be moved to tasks of the same file")
+        for record in records:
+            if record.task is task:
+                continue
+            start, end = self._row(record)
+            self._delete(record)
+            self._insert(task, start, end)
+
+    def add(self, name, start, end):
+        """Add a stopped record, given as datetimes, to the task of that name."""
+        if end < start:
+            raise ValueError("Record of {} ends before it starts: {} -- {}".format(name, start, end))
+        task = self.task(name)
+        task.load()  # Unloaded records of a task stay apart from the ones in the store until loaded
+        self._insert(task, to_epoch(start), to_epoch(end))
+
+    def task(self, name):
+        """Return the task of that name, adding it if there is none. An added task is removed again on rollback."""
+        task = self.taskmanager.tasks_by_name.get(name)
+        if task is None:
+            task = self.taskmanager.add(name)
+            self._undo.append(lambda: self.taskmanager.remove(task))
+        return task
+
+    def commit(self, message):
+        """Check all changed records for overlaps and write the changes. Raises RecordOverlap after undoing them."""
+        if not self.events:
+            return
+        taskmanager = self.taskmanager
+        changed = [Record(taskmanager.store, i) for i in self._changed if i in taskmanager.intervals]
+        try:
+            if changed:
+                taskmanager.check_for_overlapping(*changed)
+        except RecordOverlap:
+            self.rollback()
+            raise
+        taskmanager.write(message, "batch", self.events)
+        self.events, self._undo, self._changed = [], [], set()
+
+    def rollback(self):
+        """Undo all changes not written yet."""
+        while self._undo:
+            self._undo.pop()()
+        self.events, self._changed = [], set()
+        self.count = 0
+
+    def _row(self, record):
+        store = self.taskmanager.store
+        return store.starts[record.id], store.ends[record.id]
+
+    def _set(self, record, start, end):
+        old_start, old_end = self._row(record)
+        record._set(start, end)
+        self._undo.append(lambda: record._set(old_start, old_end))
+        self._changed.add(record.id)
+        self.count += 1
+        self.events.append(["edit", record.task.name, _to_datetime(old_start), _to_datetime(old_end),
+                            _to_datetime(start), _to_datetime(end)])
+
+    def _insert(self, task, start, end):
+        record_id = self.taskmanager.insert(task, start, end)
+        self._undo.append(lambda: self.taskmanager.untrack(record_id))
+        self._changed.add(record_id)
+        self.count += 1
+        self.events.append(["add", task.name, _to_datetime(start), _to_datetime(end)])
+
+    def _delete(self, record):
+        start, end = self._row(record)
+        task = record.task
+        self.taskmanager.untrack(record.id)
+        self._undo.append(lambda: self._restore(task, record.id))
+        self._changed.discard(record.id)
+        self.events.append(["delete", task.name, _to_datetime(start), _to_datetime(end)])
+
+    def _restore(self, task, record_id):
+        task.record_ids.append(record_id)
+        self.taskmanager.track(record_id)
+
+
+def _to_datetime(seconds):
+    return None if seconds == RUNNING else from_epoch(seconds)
+
+
+def read_timesheet(file_name):
+    """Return (task name, start, end) of the records of a CSV file, or of the CLOCK lines of an org-mode file."""
+    with open(file_name, "r", newline="") as input_file:
+        if file_name.lower().endswith(".csv"):
+            return list(parse_csv(input_file, file_name))
+        return list(parse_org(input_file, file_name))
+
+
+def parse_csv(lines, source):
+    """Rows of task, start and end, e.g. 'Client support,2020-12-27 10:22:10,2020-12-27 11:30:11'. Skips a header."""
+    for number, row in enumerate(csv.reader(lines), 1):
+        if not row or number == 1 and [c.strip().lower() for c in row] == ["task", "start", "end"]:
+            continue
+        try:
+            name, start, end = [c.strip() for c in row]
+            yield name, datetime.fromisoformat(start), datetime.fromisoformat(end)
+        except ValueError:
+            raise ParseError("{}:{}: Expected task, start and end in {!r}".format(source, number, ",".join(row)))
+
+
+org_clock = re.compile(r"^\s*CLOCK:\s*\[([^\]]+)\]\s*--\s*\[([^\]]+)\]")
+org_keywords = ("TODO ", "DONE ", "NEXT ", "WAITING ", "CANCELLED ")
+
+
+def parse_org(lines, source):
+    """
+    CLOCK lines below headings, as written by rata or by org-mode, e.g. 'CLOCK: [2020-12-27 Sun 10:22]--[2020-12-27
+    Sun 11:30] =>  1:08'. Anything else in the file is skipped. Headings lose their TODO keyword and tags.
+    """
+    task = None
+    for number, line in enumerate(lines, 1):
+        if line.startswith("*"):
+            task = re.sub(r"\s+:[\w@:]+:\s*$", "", line.lstrip("* ").rstrip())
+            for keyword in org_keywords:
+                if task.startswith(keyword):
+                    task = task[len(keyword):].strip()
+            continue
+        match = org_clock.match(line)
+        if match is None:
+            continue
+        if task is None:
+            raise ParseError("{}:{}: Record before the first heading {!r}".format(source, number, line))
+        try:
+            yield task, _parse_org_timestamp(match.group(1)), _parse_org_timestamp(match.group(2))
+        except ValueError:
+            raise ParseError("{}:{}: Could not parse record {!r}".format(source, number, line))
+
+
+def _parse_org_timestamp(timestamp):
+    """'2020-12-27 Sun 10:22' or rata's '2020-12-27 10:22:10'"""
+    parts = timestamp.split()
+    if len(parts) == 2 and parts[1].count(":") == 2:
+        return parse_timestamp(timestamp)
+    day, clock = parts[0], parts[-1]
+    return datetime.strptime("{} {}".format(day, clock), "%Y-%m-%d %H:%M")
+
+
+def import_records(taskmanager, records, source):
+    """Add records of a timesheet as one batch. Returns the number of records added."""
+    batch = Batch(taskmanager)
+    try:
+        for name, start, end in records:
+            batch.add(name, start, end)
+    except ValueError:
+        batch.rollback()
+        raise
+    count = batch.count
+    batch.commit("Import {} records from {}".format(count, os.path.basename(source)))
+    return count
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="rata import", description="Add the records of a CSV file with task, start "
+                                     "and end per row or of the CLOCK lines of an org-mode file to a rata file, in a "
+                                     "single commit. Nothing is added if any record overlaps another one.")
+    parser.add_argument("file", help="rata file to add the records to")
+    parser.add_argument("timesheet", help="CSV or org-mode file to import")
+    options = parser.parse_args(args)
+    if not is_inside_git_dir(options.file):
+        print(no_git_directory.format(options.file), file=sys.stderr)
+        return 1
+    try:
+        with client.handed_over(options.file):
+            taskmanager = TaskManager(options.file, lazy=True)
+            try:
+                count = import_records(taskmanager, read_timesheet(options.timesheet), options.timesheet)
+            finally:
+                taskmanager.close()
+    except (ParseError, RecordOverlap, ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print("Imported {} records into {}".format(count, options.file))
+    return 0
+
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from .records import Logbook
+
+# Binary copy of a parsed file so unchanged files don't have to be parsed again on every start. Caches are kept outside
+# of the git repository in ~/.cache/rata or $RATA_CACHE_DIR, set that to an empty value to disable caching.
+# Layout: header, task name table, all start times, all end times. Times are int64 epoch seconds in native byte order.
+# Next to it a JSON summary of the file answers `rata status` without a daemon, see summary.py.
+MAGIC = b"RATA\x02"
+HEADER = struct.Struct("=5sQQ20sI")  # magic, file size, file mtime in ns, sha1 of file, number of tasks
+TASK = struct.Struct("=IQq")  # length of encoded name, number of records, seconds archived
+
+
+def cache_dir():
+    default = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "rata")
+    return os.getenv("RATA_CACHE_DIR", default)
+
+
+def cache_name(file_name, extension="bin"):
+    if not cache_dir():
+        return None
+    key = hashlib.sha1(os.path.abspath(file_name).encode()).hexdigest()
+    return os.path.join(cache_dir(), "{}.{}".format(key, extension))
+
+
+def _fingerprint(file_name):
+    stat = os.stat(file_name)
+    with open(file_name, "rb") as input_file:
+        digest = hashlib.sha1(input_file.read()).digest()
+    return stat.st_size, stat.st_mtime_ns, digest
+
+
+def _layout(data, file_name):
+    """(task name, number of records, seconds archived) of each task and where the times start, None if outdated."""
+    magic, size, mtime, digest, task_count = HEADER.unpack_from(data)
+    stat = os.stat(file_name)
+    if magic != MAGIC or (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    if digest != _fingerprint(file_name)[2]:
+        return None
+    offset = HEADER.size
+    names = []
+    for _ in range(task_count):
+        name_length, record_count, archived = TASK.unpack_from(data, offset)
+        offset += TASK.size
+        names.append((data[offset:offset + name_length].decode(), record_count, archived))
+        offset += name_length
+    total = sum(count for _, count, _ in names)
+    if len(data) != offset + total * 16:
+        return None
+    return names, offset, total
+
+
+def load_cache(file_name):
+    """
+    Return a Logbook of task name -> (starts, ends) like io.read_columns, or None if there is no valid cache. The
+    columns are memoryviews of the mapped cache file, not copies, so it stays mapped as long as any of them is used.
+    Cache files are only ever replaced, never changed in place, which keeps the mapping valid.
+    """
+    name = cache_name(file_name)
+    try:
+        with open(name, "rb") as cache_file:
+            data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, TypeError, ValueError):
+        return None
+    try:
+        layout = _layout(data, file_name)
+    except (OSError, ValueError, struct.error):
+        layout = None
+    if layout is None:
+        data.close()
+        return None
+    names, offset, total = layout
+    view = memoryview(data)
+    starts = view[offset:offset + total * 8].cast("q")
+    ends = view[offset + total * 8:].cast("q")
+    tasks = Logbook()
+    first = 0
+    for task_name, record_count, archived in names:
+        tasks[task_name] = (starts[first:first + record_count], ends[first:first + record_count])
+        if archived:
+            tasks.archived[task_name] = archived
+        first += record_count
+    return tasks
+
+
+def save_cache(file_name, tasks):
+    """Store tasks, a Logbook of task name -> (starts, ends), as parsed from the current content of file_name."""
+    name = cache_name(file_name)
+    if not name:
+        return
+    try:
+        size, mtime, digest = _fingerprint(file_name)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        cache_file = tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(name), delete=False)
+    except OSError:
+        return  # The cache is only an optimization
+    try:
+        with cache_file:
+            cache_file.write(HEADER.pack(MAGIC, size, mtime, digest, len(tasks)))
+            for task_name, (starts, _) in tasks.items():
+                encoded = task_name.encode()
+                cache_file.write(TASK.pack(len(encoded), len(starts), tasks.archived.get(task_name, 0)))
+                cache_file.write(encoded)
+            for column in (0, 1):
+                for columns in tasks.values():
+                    cache_file.write(columns[column])
+        os.replace(cache_file.name, name)
+    except OSError:
+        os.unlink(cache_file.name)
+    except BaseException:
+        os.unlink(cache_file.name)
+        raise
+
+
+def load_summary(file_name):
+    """Return the summary saved for the file as a dict, see summary.py, or None if there is none."""
+    name = cache_name(file_name, "json")
+    try:
+        with open(name, "r") as summary_file:
+            return json.load(summary_file)
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def save_summary(file_name, summary):
+    name = cache_name(file_name, "json")
+    if not name:
+        return
+    try:
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(name), delete=False) as summary_file:
+            json.dump(summary, summary_file)
+        os.replace(summary_file.name, name)
+    except OSError:
+        pass  # The summary is only an optimization
@@ -0,0 +1,97 @@
+"""
+`rata status`, `rata start <task>`, `rata stop` and `rata switch <task>`. They ask the daemon if one is running and
+otherwise answer from the summary of the file, see summary.py. Kept apart from the daemon and the UI so calling them,
+e.g. from a shell prompt, imports little more than the parsing and IO layer.
+"""
+import argparse
+from contextlib import contextmanager
+from datetime import timedelta
+import json
+import os
+import socket
+import sys
+import tempfile
+
+from .io import format_duration
+
+timeout = 5  # Seconds to wait for the daemon, after that it is taken for not running
+
+
+def socket_path():
+    default = os.path.join(os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "rata-{}.sock".format(os.getuid()))
+    return os.getenv("RATA_SOCKET", default)
+
+
+def request(command, **arguments):
+    """Send a request to the daemon and return its reply, or None if no daemon is running or it doesn't answer."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    with connection:
+        try:
+            connection.connect(socket_path())
+            connection.sendall((json.dumps(dict(arguments, command=command)) + "\n").encode())
+            reply = connection.makefile("rb").readline()
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+            return None
+    return json.loads(reply) if reply else None
+
+
+@contextmanager
+def handed_over(file_name):
+    """
+    Have a running daemon let go of the file while the block runs, e.g. while the UI has it open. The file is handed
+    back even if the daemon didn't answer, it may still have let go of it, and only files it let go of are opened.
+    """
+    path = os.path.abspath(file_name)
+    request("release", file=path)
+    try:
+        yield
+    finally:
+        request("open", file=path)
+
+
+def describe(reply):
+    """Status reply as a line of text."""
+    today = format_duration_seconds(reply["today"])
+    running = reply["running"]
+    if running is None:
+        return "Nothing running, today {}".format(today)
+    return "{} running since {} for {}, today {}".format(
+        running["task"], running["since"], format_duration_seconds(running["seconds"]), today)
+
+
+def format_duration_seconds(seconds):
+    return format_duration(timedelta(seconds=seconds))
+
+
+def main(command, args):
+    parser = argparse.ArgumentParser(prog="rata {}".format(command), description="Ask the rata daemon or, if none is "
+                                     "running, read the file given with --file or $RATA_FILE.")
+    if command in ("start", "switch"):
+        parser.add_argument("task")
+    parser.add_argument("--file", help="rata file or folder of rata files, new tasks are added to it")
+    parser.add_argument("--json", action="store_true", help="print the reply as JSON")
+    options = parser.parse_args(args)
+    arguments = {}
+    if getattr(options, "task", None):
+        arguments["task"] = options.task
+    if options.file:
+        arguments["file"] = os.path.abspath(options.file)
+    reply = request(command, **arguments)
+    if reply is None:
+        path = options.file or os.getenv("RATA_FILE")
+        if not path:
+            print("No rata daemon running. Start one with 'rata daemon <files>' or name the file with --file or "
+                  "$RATA_FILE", file=sys.stderr)
+            return 1
+        from . import summary  # Only without a daemon
+        reply = summary.handle(command, path, **arguments)
+    if options.json:
+        print(json.dumps(reply))
+    elif not reply["ok"]:
+        print(reply["error"], file=sys.stderr)
+    else:
+        print(describe(reply))
+    return 0 if reply["ok"] else 1
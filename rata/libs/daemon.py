@@ -0,0 +1,213 @@
+"""
+rata as a long running process keeping the files in memory, so scripts, editor plugins or shell prompts can ask what is
+running and start or stop tasks without the UI and without reading the files again. Requests and replies are single
+lines of JSON on a Unix socket, e.g. {"command": "start", "task": "Client support"} is answered by {"ok": true, ...} or
+{"ok": false, "error": "..."}. The UI opened on a file the daemon keeps takes it over until it quits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+
+from .client import request, socket_path
+from .exceptions import ParseError, RecordOverlap
+from .io import datetime_format, expand_paths, is_inside_git_dir, no_git_directory
+from .rollup import periods
+from .workspace import Workspace
+
+watch_interval = 2  # Seconds between checks whether someone else changed the files
+
+
+class Daemon(object):
+
+    def __init__(self, paths):
+        self.workspace = Workspace(paths, lazy=bool(os.getenv("RATA_LAZY")))
+        self.released = []  # Files taken over by the UI
+        self.commands = {"status": self.status, "start": self.start, "stop": self.stop, "switch": self.switch,
+                         "report": self.report, "release": self.release, "open": self.open}
+
+    def handle(self, request):
+        """Answer a request, a dict with the command and its arguments."""
+        if not isinstance(request, dict) or request.get("command") not in self.commands:
+            return {"ok": False, "error": "Unknown command, use one of {}".format(", ".join(self.commands))}
+        try:
+            reply = self.commands[request["command"]](request)
+        except (ValueError, RecordOverlap, ParseError) as e:
+            return {"ok": False, "error": str(e)}
+        reply["ok"] = True
+        return reply
+
+    def status(self, request):
+        """What is running since when, and the time tracked today."""
+        task = self.workspace.find_running_task()
+        reply = {"running": None, "today": int(self.workspace.todays_duration.total_seconds())}
+        if task is not None:
+            record = task.running_record
+            reply["running"] = {"file": task.taskmanager.file_name, "task": task.name,
+                                "since": record.start.strftime(datetime_format),
+                                "seconds": int(record.duration.total_seconds()),
+                                "task_seconds": int(task.duration.total_seconds())}
+        return reply
+
+    def start(self, request):
+        task = self.workspace.find_running_task()
+        if task is not None:
+            raise ValueError("{} is running already, use switch".format(task.name))
+        self._task(request, create=True).start()
+        return self.status(request)
+
+    def stop(self, request):
+        task = self.workspace.find_running_task()
+        if task is None:
+            raise ValueError("Nothing is running")
+        task.stop()
+        return self.status(request)
+
+    def switch(self, request):
+        """Stop what is running, if anything, and start the given task. Nothing changes if it is running already."""
+        task = self._task(request, create=True)
+        running = self.workspace.find_running_task()
+        if running is task:
+            return self.status(request)
+        if running is not None:
+            running.stop()
+        task.start()
+        return self.status(request)
+
+    def report(self, request):
+        """
+        Seconds per task of each file, in total or for one of the periods like "this week". Only the total includes
+        archived records, archived_included says whether the seconds do.
+        """
+        period = request.get("period", "total")
+        if period != "total" and period not in periods:
+            raise ValueError("Unknown period, use total or one of {}".format(", ".join(periods)))
+        files = {}
+        for taskmanager in self._taskmanagers(request.get("file")):
+            files[taskmanager.file_name] = {
+                task.name: int((task.duration if period == "total" else taskmanager.period_duration(period, task))
+                               .total_seconds()) for task in taskmanager.tasks}
+        return {"period": period, "files": files, "archived_included": period == "total"}
+
+    def release(self, request):
+        """Hand the files of a path over to the UI, which changes them until it calls open."""
+        file_names = []
+        for taskmanager in self._taskmanagers(request.get("file"), required=False):
+            self.workspace.release(taskmanager)
+            self.released.append(taskmanager.file_name)
+            file_names.append(taskmanager.file_name)
+        return {"released": file_names}
+
+    def open(self, request):
+        """Keep the files of a path again, reading them as the UI left them."""
+        paths = self._paths(request.get("file"))
+        file_names = [f for f in self.released if os.path.abspath(f) in paths]
+        for file_name in file_names:
+            self.released.remove(file_name)
+            self.workspace.open(file_name)
+        return {"opened": file_names}
+
+    def _paths(self, path):
+        if not path:
+            raise ValueError("No file given")
+        return {os.path.abspath(f) for f in expand_paths([path])}
+
+    def _taskmanagers(self, path=None, required=True):
+        """TaskManagers of the files of a path, all of them if none is given."""
+        if path is None:
+            return self.workspace.taskmanagers[:]
+        paths = self._paths(path)
+        taskmanagers = [t for t in self.workspace.taskmanagers if os.path.abspath(t.file_name) in paths]
+        if required and not taskmanagers:
+            raise ValueError("{} is not kept by the daemon".format(path))
+        return taskmanagers
+
+    def _task(self, request, create=False):
+        """Task named in the request, looked up in all files unless one is named. New tasks need a file."""
+        name = request.get("task")
+        if not name:
+            raise ValueError("No task given")
+        taskmanagers = self._taskmanagers(request.get("file"))
+        for taskmanager in taskmanagers:
+            if name in taskmanager.tasks_by_name:
+                return taskmanager.tasks_by_name[name]
+        if not create:
+            raise ValueError("No task named {}".format(name))
+        if len(taskmanagers) != 1:
+            raise ValueError("No task named {}, name the file to add it to".format(name))
+        return taskmanagers[0].add(name)
+
+    def watch(self):
+        """Pick up changes others made to the files."""
+        for taskmanager in self.workspace.taskmanagers:
+            try:
+                taskmanager.reload()
+            except (ParseError, RecordOverlap) as e:
+                print(e, file=sys.stderr)
+
+    async def serve(self, path):
+        """Answer requests on the socket until SIGINT or SIGTERM."""
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stopped.set)
+        umask = os.umask(0o077)  # Only the user may connect, from the moment the socket exists
+        try:
+            server = await asyncio.start_unix_server(self._connection, path)
+        finally:
+            os.umask(umask)
+        async with server:
+            while not stopped.is_set():
+                try:
+                    await asyncio.wait_for(stopped.wait(), watch_interval)
+                except asyncio.TimeoutError:
+                    self.watch()
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line))
+                except ValueError:
+                    reply = {"ok": False, "error": "Requests have to be a line of JSON"}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def close(self):
+        self.workspace.close()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="rata daemon", description="Keep rata files in memory and answer requests "
+                                     "from 'rata status', 'rata start <task>', 'rata stop' and 'rata switch <task>'.")
+    parser.add_argument("files", nargs="+", help="rata files or folders of rata files")
+    options = parser.parse_args(args)
+    for path in options.files:
+        if not is_inside_git_dir(path):
+            print(no_git_directory.format(path), file=sys.stderr)
+            return 1
+    path = socket_path()
+    if request("status") is not None:
+        print("A rata daemon is running already on {}".format(path), file=sys.stderr)
+        return 1
+    if os.path.exists(path):  # Left over from a daemon that was killed
+        os.unlink(path)
+    try:
+        daemon = Daemon(options.files)
+    except (ParseError, RecordOverlap) as e:
+        print(e, file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(daemon.serve(path))
+    finally:
+        daemon.close()
+        if os.path.exists(path):
+            os.unlink(path)
+    return 0
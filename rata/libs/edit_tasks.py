@@ -1,19 +1,27 @@
+from datetime import datetime, timedelta
+
 import urwid
 
-from .widgets import RecordEdit, RecordButton
+from .bulk import Batch
+from .exceptions import RecordOverlap
+from .io import datetime_format
+from .widgets import Prompt, RecordEdit, RecordButton
 
 
-def make_edit_task_screen(application):
+def make_edit_task_screen(application, task=None, selected=()):
+    """Records of the task under the cursor, or of the given task with the records of the given rows selected."""
     application.view = "edit"
+    if task is None:
+        task = application.body.base_widget.focus.base_widget.task
+    application.edited_task = task
     body = [urwid.Text("Edit records"), urwid.Divider()]
-    task = application.body.base_widget.focus.base_widget.task
-    task.records.sort(key=lambda r: r.start, reverse=True)
-    for r in task.records:
-        button = RecordButton(r, application)
+    for r in sorted(task.records, key=lambda r: r.start, reverse=True):
+        button = RecordButton(r, application, r.id in selected)
         urwid.connect_signal(button, 'click', _edit_record, (application, r))
         body.append(button)
     body += [urwid.Divider(),
              urwid.Text("Enter: edit | h/j: Move start up/down | k/l: Move end up/down | Esc: cancel"),
+             urwid.Text("Space: select | Selected records at once: (S)hift | (M)erge | split (x) | move (t)o task"),
              urwid.Divider(),
              application.message_box]
     return urwid.Padding(urwid.ListBox(urwid.SimpleFocusListWalker(body)), left=0, right=0)
@@ -26,3 +34,83 @@ def _edit_record(button, record_tuple):
             RecordEdit(application, record, edit_text=record.label),
             urwid.Divider(),
             application.message_box])
+
+
+def bulk_edit(application, key):
+    """Change the selected records, or the one under the cursor if none is selected, as a single batch."""
+    buttons = [w for w in application.body.base_widget.body if isinstance(w, RecordButton)]
+    records = [b.record for b in buttons if b.selected]
+    if not records:
+        focus = application.body.base_widget.focus
+        records = [focus.record] if isinstance(focus, RecordButton) else []
+    if not records:
+        return
+    task = application.edited_task
+    if key == "M":
+        _apply(application, task, records, lambda batch: batch.merge(records), "{}: Merge {} records".format(
+            task.name[:30], len(records)))
+    elif key == "S":
+        _prompt(application, task, records, "Shift {} records by minutes, negative for earlier:\n".format(
+            len(records)), "", lambda text: _shift(application, task, records, text))
+    elif key == "x":
+        record = records[0]
+        middle = record.start + ((record.end or datetime.now().replace(microsecond=0)) - record.start) / 2
+        _prompt(application, task, records, "Split {} at:\n".format(record.label), middle.strftime(datetime_format),
+                lambda text: _split(application, task, record, text))
+    elif key == "t":
+        _prompt(application, task, records, "Move {} records to task:\n".format(len(records)), "",
+                lambda text: _move(application, task, records, text))
+
+
+def _shift(application, task, records, text):
+    try:
+        delta = timedelta(minutes=int(text))
+    except ValueError:
+        _back(application, task, records, "Invalid input: enter a number of minutes", error=True)
+        return
+    _apply(application, task, records, lambda batch: batch.shift(records, delta),
+           "{}: Shift {} records by {} min".format(task.name[:30], len(records), int(text)))
+
+
+def _split(application, task, record, text):
+    try:
+        moment = datetime.strptime(text.strip(), datetime_format)
+    except ValueError:
+        _back(application, task, [record], "Invalid input: enter a time like {}".format(datetime_format), error=True)
+        return
+    _apply(application, task, [record], lambda batch: batch.split(record, moment), "{}: Split record".format(
+        task.name[:30]))
+
+
+def _move(application, task, records, text):
+    name = text.strip()
+    if not name:
+        _back(application, task, records, "Invalid input: enter a task name", error=True)
+        return
+    _apply(application, task, records, lambda batch: batch.move(records, batch.task(name)),
+           "{}: Move {} records to '{}'".format(task.name[:30], len(records), name))
+
+
+def _apply(application, task, records, change, message):
+    """Make the change in one batch. Keeps the records selected if it failed."""
+    batch = Batch(task.taskmanager)
+    try:
+        change(batch)
+        batch.commit(message)
+    except (ValueError, RecordOverlap) as e:
+        batch.rollback()
+        _back(application, task, records, "Failed to edit. {}".format(e), error=True)
+        return
+    application.current_task = application.workspace.find_running_task()
+    _back(application, task, [], "Edit saved.")
+
+
+def _prompt(application, task, records, caption, text, on_enter):
+    application.view = "bulk edit"
+    edit = Prompt(on_enter, lambda: _back(application, task, records, ""), caption, edit_text=text)
+    application.body.original_widget = urwid.Filler(edit)
+
+
+def _back(application, task, records, message, error=False):
+    application.body.original_widget = make_edit_task_screen(application, task, {r.id for r in records})
+    application.set_message(message, error=error)
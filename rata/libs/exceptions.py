@@ -1,2 +1,6 @@
 class RecordOverlap(Exception):
     pass
+
+
+class ParseError(Exception):
+    pass
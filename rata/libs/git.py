@@ -0,0 +1,235 @@
+import hashlib
+import os
+import subprocess
+import time
+
+from .profiling import timed
+
+no_git_directory = "No git directory: {}. rata expects its files to be git-versioned."
+
+
+def _git(directory, *args):
+    """Run a git command without a shell, return (success, stdout)."""
+    process = subprocess.run(["git"] + list(args), cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return process.returncode == 0, process.stdout
+
+
+def is_inside_git_dir(path):
+    """
+    Whether the file, or the folder of a workspace, is in a git work tree. Looks for .git in the folder and above
+    instead of starting git, which is asked only if $GIT_DIR or $GIT_WORK_TREE point elsewhere.
+    """
+    directory = path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+    if os.getenv("GIT_DIR") or os.getenv("GIT_WORK_TREE"):
+        success, output = _git(directory, "rev-parse", "--is-inside-work-tree")
+        return success and output == b'true\n'
+    directory = os.path.abspath(directory)
+    while True:
+        if os.path.exists(os.path.join(directory, ".git")):  # A folder, or a file in worktrees and submodules
+            return True
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return False
+        directory = parent
+
+
+@timed("git_commit")
+def git_commit(file_name, message, *others):
+    """Commit the file, and other files of its repository, with separate git commands, return False if git failed."""
+    directory = os.path.dirname(os.path.abspath(file_name))
+    for args in (["reset", "-q", "."], ["add", "--"] + [os.path.abspath(f) for f in (file_name,) + others]):
+        if not _git(directory, *args)[0]:
+            return False
+    if _git(directory, "diff", "--cached", "--quiet")[0]:
+        return True  # Nothing to commit
+    return _git(directory, "commit", "-q", "-m", "rata: {}".format(message))[0]
+
+
+def blob_id(content):
+    """Object id git gives to a file with this content."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class SubprocessBackend(object):
+    """Starts git reset, add and commit for every commit."""
+
+    def commit(self, file_name, message):
+        return git_commit(file_name, message)
+
+    def close(self):
+        pass
+
+
+class FastImportBackend(object):
+    """
+    Commits through one long running `git fast-import` per repository, writing the file's blob, the tree and the
+    commit in a single round trip. Falls back to git_commit when fast-import can't be used, e.g. on a detached HEAD.
+    fast-import doesn't touch the index, so the index entry of the file is set to the committed blob after each commit.
+    Otherwise a commit made by hand meanwhile would undo rata's changes and `git pull` would refuse to merge.
+    """
+
+    def __init__(self):
+        self.importers = {}  # directory of the file -> _Importer, or None if fast-import can't be used there
+
+    @timed("fast-import commit")
+    def commit(self, file_name, message):
+        directory = os.path.dirname(os.path.abspath(file_name))
+        if directory not in self.importers:
+            self.importers[directory] = _Importer.start(directory)
+        importer = self.importers[directory]
+        if importer is not None and importer.commit(file_name, message):
+            return True
+        if importer is not None:  # fast-import died, start a new one with the next commit
+            importer.close()
+            del self.importers[directory]
+        return git_commit(file_name, message)
+
+    def close(self):
+        for importer in self.importers.values():
+            if importer is not None:
+                importer.close()
+        self.importers = {}
+
+
+class _Importer(object):
+
+    def __init__(self, root, branch, identity, process):
+        self.root = root
+        self.branch = branch
+        self.identity = identity
+        self.process = process
+        self.committed = {}  # path in repository -> blob id committed last
+        self.unstaged = set()  # Paths whose index entry couldn't be updated yet, e.g. while git held the index lock
+        self.checkpoints = 0
+
+    @classmethod
+    def start(cls, directory):
+        success, root = _git(directory, "rev-parse", "--show-toplevel")
+        if not success:
+            return None
+        success, branch = _git(directory, "symbolic-ref", "-q", "HEAD")
+        if not success:  # Detached HEAD
+            return None
+        success, identity = _git(directory, "var", "GIT_COMMITTER_IDENT")
+        if not success:
+            return None
+        process = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=directory, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        # "Name <email> 1609064530 +0100", time and timezone are set per commit
+        identity = identity.decode().strip().rsplit(" ", 2)[0]
+        return cls(root.decode().strip(), branch.decode().strip(), identity, process)
+
+    def commit(self, file_name, message):
+        path = os.path.relpath(os.path.realpath(file_name), os.path.realpath(self.root)).replace(os.sep, "/")
+        with open(file_name, "rb") as input_file:
+            content = input_file.read()
+        if path not in self.committed:
+            success, head = _git(self.root, "rev-parse", "-q", "--verify", "HEAD:{}".format(path))
+            self.committed[path] = head.decode().strip() if success else None
+        if blob_id(content) == self.committed[path]:
+            return True  # Nothing to commit
+        has_parent = _git(self.root, "rev-parse", "-q", "--verify", self.branch)[0] if self.checkpoints == 0 else True
+        message = "rata: {}".format(message).encode()
+        offset = time.localtime().tm_gmtoff
+        stream = b"".join([
+            "commit {}\n".format(self.branch).encode(),
+            "committer {} {} {}{:02d}{:02d}\n".format(
+                self.identity, int(time.time()), "-" if offset < 0 else "+", abs(offset) // 3600,
+                abs(offset) % 3600 // 60).encode(),
+            b"data %d\n" % len(message), message, b"\n",
+            # ^0 makes fast-import read the branch from the repository, in case somebody else committed meanwhile
+            "from {}^0\n".format(self.branch).encode() if has_parent else b"",
+            'M 100644 inline "{}"\n'.format(path.replace("\\", "\\\\").replace('"', '\\"')).encode(),
+            b"data %d\n" % len(content), content, b"\n",
+            # checkpoint updates the branch, progress tells us when that happened
+            "checkpoint\n\nprogress rata {}\n\n".format(self.checkpoints).encode(),
+        ])
+        try:
+            self.process.stdin.write(stream)
+            self.process.stdin.flush()
+            reply = self.process.stdout.readline()
+        except OSError:
+            return False
+        if reply != "progress rata {}\n".format(self.checkpoints).encode():
+            return False
+        self.checkpoints += 1
+        self.committed[path] = blob_id(content)
+        self.unstaged.add(path)
+        self.stage()
+        return True
+
+    def stage(self):
+        """Set the index entries of committed files to the committed blobs, as `git commit` would have."""
+        if not self.unstaged:
+            return
+        arguments = []
+        for path in self.unstaged:
+            arguments += ["--cacheinfo", "100644,{},{}".format(self.committed[path], path)]
+        if _git(self.root, "update-index", *arguments)[0]:
+            self.unstaged = set()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self.stage()
+        if self.committed:
+            _git(self.root, "gc", "--auto", "--quiet")
+
+
+def file_log(file_name):
+    """Return (commit id, commit time, subject, blob id) of each commit changing the file, newest first."""
+    directory = os.path.dirname(os.path.abspath(file_name))
+    success, output = _git(directory, "log", "--format=%x00%H %ct %s", "--raw", "--no-abbrev", "--no-renames", "--",
+                           os.path.abspath(file_name))
+    if not success:
+        return []
+    commits = []
+    for entry in output.decode(errors="replace").split("\0")[1:]:
+        lines = entry.splitlines()
+        commit_id, timestamp, subject = (lines[0].split(" ", 2) + [""])[:3]
+        raw = [line for line in lines[1:] if line.startswith(":")]
+        if not raw:
+            continue
+        blob = raw[0].split()[3]  # ":100644 100644 <old blob> <new blob> M\t<path>"
+        commits.append((commit_id, int(timestamp), subject, None if set(blob) == {"0"} else blob))
+    return commits
+
+
+class BlobReader(object):
+    """Reads file contents from the repository through one long running `git cat-file --batch`."""
+    batch_size = 100  # Ids written before reading the replies, small enough to never fill the pipe
+
+    def __init__(self, directory):
+        self.process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=directory, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(self, blob_ids):
+        """Return the content of each blob, None for blobs that don't exist."""
+        contents = []
+        for first in range(0, len(blob_ids), self.batch_size):
+            batch = blob_ids[first:first + self.batch_size]
+            self.process.stdin.write("".join("{}\n".format(blob_id) for blob_id in batch).encode())
+            self.process.stdin.flush()
+            for _ in batch:
+                header = self.process.stdout.readline().split()
+                if len(header) != 3:  # "<id> missing"
+                    contents.append(None)
+                    continue
+                contents.append(self.process.stdout.read(int(header[2])))
+                self.process.stdout.read(1)  # Newline after the content
+        return contents
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+backends = {"fast-import": FastImportBackend, "subprocess": SubprocessBackend}
+
+
+def commit_backend(name=None):
+    """Return a new commit backend, by default the one named by $RATA_GIT_BACKEND or fast-import."""
+    return backends[name or os.getenv("RATA_GIT_BACKEND", "fast-import")]()
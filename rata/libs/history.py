@@ -0,0 +1,90 @@
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+import os
+
+from .git import BlobReader, file_log
+from .io import parse_records
+from .records import to_epoch
+
+
+class History(object):
+    """
+    The commits of a file and the time tracked per task at each of them. Versions of the file are read in batches
+    through a single `git cat-file` and parsed at most once while in the cache, which is keyed by blob id as the same
+    content comes back e.g. after reverting a change.
+    """
+
+    def __init__(self, file_name, cache_size=256):
+        self.file_name = file_name
+        self.cache_size = cache_size
+        self.commits = []  # (commit id, commit time, subject, blob id), newest first
+        self._cache = OrderedDict()  # blob id -> dict of task name -> seconds, least recently used first
+        self._reader = None
+
+    def update(self):
+        """Read the list of commits again, e.g. after rata committed since."""
+        self.commits = file_log(self.file_name)
+
+    def totals(self, *commits):
+        """Return dict of task name -> seconds at each commit. Running records are counted up to the commit."""
+        parsed = {}  # blob id -> parsed content, for more commits than fit into the cache
+        missing = []
+        for blob_id in OrderedDict.fromkeys(c[3] for c in commits if c[3] is not None):
+            if blob_id in self._cache:
+                self._cache.move_to_end(blob_id)
+                parsed[blob_id] = self._cache[blob_id]
+            else:
+                missing.append(blob_id)
+        if missing:
+            if self._reader is None:
+                self._reader = BlobReader(os.path.dirname(os.path.abspath(self.file_name)))
+            for blob_id, content in zip(missing, self._reader.read(missing)):
+                parsed[blob_id] = self._parse(blob_id, content or b"")
+                self._remember(blob_id, parsed[blob_id])
+        results = []
+        for commit_id, timestamp, _, blob_id in commits:
+            if blob_id is None:  # Deleted in this commit
+                results.append({})
+                continue
+            seconds, running = parsed[blob_id]
+            totals = dict(seconds)
+            committed = to_epoch(datetime.fromtimestamp(timestamp))  # Local time like the records
+            for task, start in running:
+                totals[task] = totals.get(task, 0) + max(0, committed - start)
+            results.append(totals)
+        return results
+
+    def diff(self, old, new):
+        """Return (task name, seconds at old, seconds at new) for each task that differs between two commits."""
+        old_totals, new_totals = self.totals(old, new)
+        return [(task, old_totals.get(task, 0), new_totals.get(task, 0)) for task in
+                sorted(set(old_totals) | set(new_totals), key=str.lower)
+                if old_totals.get(task, 0) != new_totals.get(task, 0)]
+
+    def previous(self, commit):
+        """Commit before the given one, None for the first."""
+        position = self.commits.index(commit)
+        return self.commits[position + 1] if position + 1 < len(self.commits) else None
+
+    def _parse(self, blob_id, content):
+        """Return seconds of stopped and archived records per task and (task, start) of running ones."""
+        seconds = defaultdict(int)
+        running = []
+        for task, start, end in parse_records(content.decode(errors="replace").splitlines(True), blob_id[:10]):
+            if start is None:
+                seconds[task] += end or 0  # Seconds in archive files, or 0 for the heading
+            elif end is None:
+                running.append((task, to_epoch(start)))
+            else:
+                seconds[task] += int((end - start).total_seconds())
+        return dict(seconds), running
+
+    def _remember(self, blob_id, parsed):
+        self._cache[blob_id] = parsed
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,93 @@
+from bisect import bisect_left
+
+
+class IntervalIndex(object):
+    """
+    Keeps the ids of all records in a RecordStore ordered by their start time. As valid records never overlap, their
+    end times are ordered as well and a single record only needs to be compared to its direct neighbours.
+    Its place is found by bisection in O(log n), but adding or discarding a record shifts the keys after it, which is
+    O(n) moves. That is a single memmove, much cheaper than sorting again or comparing all pairs, yet not logarithmic.
+    All times are epoch seconds, running records end at `now`.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._keys = []  # (start, record id), sorted
+        self._indexed = {}  # record id -> key it is currently sorted by
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return (record_id for _, record_id in self._keys)
+
+    def __contains__(self, record_id):
+        return record_id in self._indexed
+
+    def add(self, record_id):
+        key = (self.store.starts[record_id], record_id)
+        self._keys.insert(bisect_left(self._keys, key), key)
+        self._indexed[record_id] = key
+
+    def extend(self, record_ids):
+        """Add many records at once, sorting only once."""
+        starts = self.store.starts
+        for record_id in record_ids:
+            key = (starts[record_id], record_id)
+            self._keys.append(key)
+            self._indexed[record_id] = key
+        self._keys.sort()
+
+    def discard(self, record_id):
+        key = self._indexed.pop(record_id, None)
+        if key is None:
+            return
+        del self._keys[bisect_left(self._keys, key)]
+
+    def overlap(self, first, second, now):
+        """Return how many seconds two records share."""
+        store = self.store
+        latest_start = max(store.starts[first], store.starts[second])
+        earliest_end = min(store.end(first, now), store.end(second, now))
+        return earliest_end - latest_start
+
+    def _is_empty(self, record_id, now):
+        return self.store.end(record_id, now) <= self.store.starts[record_id]
+
+    def find_overlap(self, record_id, now):
+        """Return the id of a record overlapping the given one, looking only at its neighbours."""
+        if self._is_empty(record_id, now):
+            return None
+        keys = self._keys
+        position = bisect_left(keys, self._indexed[record_id])
+        # Records of zero length never overlap anything, skip over them to the next real neighbour.
+        for i in range(position - 1, -1, -1):
+            other = keys[i][1]
+            if not self._is_empty(other, now):
+                if self.overlap(record_id, other, now) > 0:
+                    return other
+                break
+        for i in range(position + 1, len(keys)):
+            other = keys[i][1]
+            if not self._is_empty(other, now):
+                if self.overlap(record_id, other, now) > 0:
+                    return other
+                break
+        return None
+
+    def sweep(self, now):
+        """Check all records in one pass. Return the ids of the first pair of overlapping records or None."""
+        store = self.store
+        latest = None  # record reaching furthest into the future so far
+        latest_end = None
+        for start, record_id in self._keys:
+            end = store.end(record_id, now)
+            if end <= start:
+                continue
+            if latest is not None:
+                if latest_end > start:
+                    return latest, record_id
+                if end <= latest_end:
+                    continue
+            latest, latest_end = record_id, end
+        return None
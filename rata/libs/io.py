@@ -1,52 +1,402 @@
+from array import array
+from contextlib import contextmanager
 from datetime import datetime
+import hashlib
+from itertools import groupby
+import json
 import os
-import shutil
-import subprocess
+import stat
 import tempfile
+import threading
+import time
 
-datetime_format = "%Y-%m-%d %H:%M:%S"
+try:
+    import fcntl
+except ImportError:  # Not on Windows, locks then only hold within one process
+    fcntl = None
+
+from .cache import load_cache, save_cache
+from .exceptions import ParseError
+from .git import commit_backend, git_commit, is_inside_git_dir, no_git_directory  # noqa: F401
+from .profiling import timed
+from .records import RUNNING, Logbook, to_epoch
 
+# Reading the umask means setting it, so it is read once on import rather than while other threads create files
+_umask = os.umask(0o022)
+os.umask(_umask)
 
-def is_inside_git_dir(file_name):
-    cmd = 'cd {} && git rev-parse --is-inside-work-tree'.format(os.path.dirname(os.path.abspath(file_name)))
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    return process.stdout.read() == b'true\n'
+datetime_format = "%Y-%m-%d %H:%M:%S"
 
 
-def read_file(file_name):
-    tasks = {}
+def iter_records(file_name):
+    """
+    Yield (task name, start, end) for every record of the file, reading it one line at a time. Task headings are
+    yielded as (task name, None, None) so tasks without records are not lost, the seconds a task has in archive files
+    as (task name, None, seconds). Changes in the journal are not included.
+    """
     with open(file_name, "r") as input_file:
-        for line in input_file:
-            if line.strip() in (":LOGBOOK:", ":END:"):
-                continue
-            elif line.startswith("*"):
-                task = line.lstrip("* ").rstrip()
-                if task not in tasks:
-                    tasks[task] = []
-            else:
-                assert line.startswith("CLOCK:"), line
-                # CLOCK: [2020-12-11 Fr 10:26]--[2020-12-11 Fr 12:00] => 01:34
+        yield from parse_records(input_file, file_name)
+
+
+def parse_records(lines, source):
+    """Like iter_records, for lines from elsewhere, e.g. an older version of the file. source is named in errors."""
+    task = None
+    for number, line in enumerate(lines, 1):
+        if line.startswith("CLOCK:") and task is not None:  # By far the most lines, so checked first
+            try:
                 start, end = parse_line(line)
-                tasks[task].append([start, end])
+            except ValueError:
+                raise ParseError("{}:{}: Could not parse record {!r}".format(source, number, line))
+            if end and end < start:
+                raise ParseError("{}:{}: Record ends before it starts {!r}".format(source, number, line))
+            yield task, start, end
+        elif line.startswith("ARCHIVED:") and task is not None:
+            try:
+                yield task, None, parse_archived(line)
+            except ValueError:
+                raise ParseError("{}:{}: Could not parse archived total {!r}".format(source, number, line))
+        elif line.startswith("*"):
+            task = line.lstrip("* ").rstrip()
+            yield task, None, None
+        elif line.strip() not in (":LOGBOOK:", ":END:"):
+            raise ParseError("{}:{}: Unexpected line {!r}".format(source, number, line))
+
+
+@timed("read_file")
+def read_file(file_name, journals=None):
+    """
+    Read tasks as Logbook of task name -> list of [start, end], including changes still in the journals, by default
+    all of them, see journal_names.
+    """
+    journals = journal_names(file_name) if journals is None else journals
+    tasks = Logbook()
+    try:
+        for name, start, end in iter_records(file_name):
+            if start is None:
+                records = tasks.setdefault(name, [])
+                if end is not None:
+                    tasks.archived[name] = end
+            else:
+                records.append([start, end])
+    except FileNotFoundError:
+        if not any(os.path.exists(journal) for journal in journals):
+            raise
+    replay_journal(tasks, file_name, journals)
+    return tasks
+
+
+@timed("read_columns")
+def read_columns(file_name):
+    """
+    Read tasks as Logbook of task name -> (starts, ends), two arrays of epoch seconds with running records ending at
+    RUNNING. Skips creating datetime and list objects for every record, which makes it the faster way to load big files.
+    Unchanged files are read from a binary cache instead of being parsed.
+    """
+    if has_journal(file_name):
+        return to_columns(read_file(file_name))
+    tasks = load_cache(file_name)
+    if tasks is None:
+        tasks = _parse_columns(file_name)
+        save_cache(file_name, tasks)
     return tasks
 
 
-def write_file(tasks, file_name, message):
-    tasks = tasks[:]
-    tasks.sort(key=lambda t: t.name.lower())
-    tmp_file = tempfile.NamedTemporaryFile("w+t", delete=False)
-    for t in tasks:
-        tmp_file.write("* {}\n".format(t.name))
-        tmp_file.write(":LOGBOOK:\n")
-        records = t.records[:]
-        records.sort(key=lambda r: r.start, reverse=True)
-        for start, end in [(r.start, r.end) for r in records]:
-            tmp_file.write("CLOCK: {}\n".format(format_record(start, end)))
-        tmp_file.write(":END:\n")
-    tmp_file.close()
-    shutil.copyfile(tmp_file.name, file_name)
-    git_commit(file_name, message)
-    os.unlink(tmp_file.name)
+def to_columns(tasks):
+    """Turn task name -> list of [start, end] into a Logbook of task name -> (starts, ends) epoch second arrays."""
+    columns = Logbook(archived=dict(getattr(tasks, "archived", {})))
+    for name, records in tasks.items():
+        columns[name] = (array("q", [to_epoch(start) for start, _ in records]),
+                         array("q", [RUNNING if end is None else to_epoch(end) for _, end in records]))
+    return columns
+
+
+def _parse_columns(file_name):
+    tasks = Logbook()
+    for name, start, end in iter_records(file_name):
+        if start is None:
+            starts, ends = tasks.setdefault(name, (array("q"), array("q")))
+            if end is not None:
+                tasks.archived[name] = end
+        else:
+            starts.append(to_epoch(start))
+            ends.append(RUNNING if end is None else to_epoch(end))
+    return tasks
+
+
+@timed("write_file")
+def write_file(tasks, file_name, before_replace=None):
+    """
+    Write tasks, a dict of task name -> list of [start, end], in org-mode style, with the archived totals of a Logbook.
+    A temporary file next to it replaces the file at once, so a crash never leaves it half-written. before_replace is
+    called with the name of the temporary file once it is complete. Returns False if the file had this content already
+    and was left untouched.
+    """
+    archived = getattr(tasks, "archived", {})
+    lines = []
+    for name in sorted(tasks, key=lambda n: n.lower()):
+        lines.append("* {}\n".format(name))
+        lines.append(":LOGBOOK:\n")
+        if archived.get(name):
+            lines.append("ARCHIVED: {}\n".format(format_archived(archived[name])))
+        records = sorted(tasks[name], key=lambda r: r[0], reverse=True)
+        for start, end in records:
+            lines.append("CLOCK: {}\n".format(format_record(start, end)))
+        lines.append(":END:\n")
+    content = "".join(lines)
+    try:
+        with open(file_name, "r") as input_file:
+            if input_file.read() == content:
+                return False
+        mode = stat.S_IMODE(os.stat(file_name).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask  # As open() would create it
+    directory = os.path.dirname(os.path.abspath(file_name))
+    tmp_file = tempfile.NamedTemporaryFile("w", dir=directory, prefix=".{}.".format(os.path.basename(file_name)),
+                                           suffix=".tmp", delete=False)
+    try:
+        with tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_file.name, mode)
+        if before_replace is not None:
+            before_replace(tmp_file.name)
+        os.replace(tmp_file.name, file_name)
+    except BaseException:
+        os.unlink(tmp_file.name)
+        raise
+    _fsync_directory(directory)
+    return True
+
+
+def _fsync_directory(directory):
+    """Make a rename in the directory survive a power loss. Not possible everywhere, e.g. on Windows."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def checksum(file_name):
+    with open(file_name, "rb") as input_file:
+        return hashlib.sha1(input_file.read()).hexdigest()
+
+
+def file_state(file_name):
+    """Modification time and size of the file, to notice changes. None if it doesn't exist."""
+    try:
+        stat_result = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    return stat_result.st_mtime_ns, stat_result.st_size
+
+
+def journal_name(file_name):
+    return "{}.journal".format(file_name)
+
+
+def compacting_name(file_name):
+    """The journal while it is folded into the file, hidden so it isn't taken for a logbook of a folder."""
+    directory, base_name = os.path.split(file_name)
+    return os.path.join(directory, ".{}.compacting.journal".format(base_name))
+
+
+def journal_names(file_name):
+    """Journals replayed on top of the file, the older one first."""
+    return [compacting_name(file_name), journal_name(file_name)]
+
+
+def has_journal(file_name):
+    return any(os.path.exists(journal) for journal in journal_names(file_name))
+
+
+def lock_name(file_name, purpose):
+    directory, base_name = os.path.split(file_name)
+    return os.path.join(directory, ".{}.{}.lock".format(base_name, purpose))
+
+
+_locks = {}  # (absolute file name, purpose) -> threading.Lock
+_locks_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(file_name, purpose, wait=True):
+    """
+    Hold a lock of the file for one purpose: "journal" while appending to the journal or swapping it out, "compact" while
+    folding a journal into the file. Yields whether the lock was taken, which it may not be if wait is False.
+    Threads of one process share a threading.Lock, processes, e.g. the UI and `rata start`, an flock of a hidden file
+    next to the file. The lock file stays, deleting it would let two processes lock different files of the same name.
+    """
+    with _locks_lock:
+        lock = _locks.setdefault((os.path.abspath(file_name), purpose), threading.Lock())
+    if not lock.acquire(wait):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        with open(lock_name(file_name, purpose), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    finally:
+        lock.release()
+
+
+def append_journal(file_name, event):
+    """
+    Append a single change to the journal next to the file, so a change costs the same no matter how long the history
+    is. Events are one JSON list per line, e.g. ["stop", "Client support", "2020-12-27 10:22:10", "2020-12-27 11:30:11"]
+    Changes made at once are a single "batch" event holding a list of events, so they are replayed all or not at all.
+    """
+    with file_lock(file_name, "journal"):
+        _append(journal_name(file_name), event)
+
+
+def _append(journal_file_name, event):
+    with open(journal_file_name, "a") as journal:
+        journal.write(json.dumps(_serialize(list(event))) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.strftime(datetime_format)
+    if isinstance(value, list):
+        return [_serialize(v) for v in value]
+    return value
+
+
+def replay_journal(tasks, file_name, journals=None):
+    """
+    Apply events of the journals, by default all of them, to tasks read from the file, each exactly once. Events before
+    a "folded" line whose checksum matches the file are in the file already, see compact().
+    """
+    file_checksum = None
+    for journal_file_name in journal_names(file_name) if journals is None else journals:
+        try:
+            with open(journal_file_name, "r") as journal:
+                lines = journal.readlines()
+        except FileNotFoundError:
+            continue
+        file_checksum = _replay_lines(tasks, file_name, lines, file_checksum)
+
+
+def _replay_lines(tasks, file_name, lines, file_checksum):
+    """Replay the lines of one journal, returns the checksum of the file if it had to be computed."""
+    events = []
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:  # Last line may be cut off if we crashed while appending
+            continue
+        if event[0] != "folded":
+            events.append(event)
+            continue
+        if file_checksum is None:
+            file_checksum = checksum(file_name) if os.path.exists(file_name) else ""
+        if event[1] == file_checksum:
+            events = []
+    for event in events:
+        _replay_event(tasks, *event)
+    return file_checksum
+
+
+def _replay_event(tasks, event, *values):
+    if event == "batch":
+        for batched in values[0]:
+            _replay_event(tasks, *batched)
+        return
+    if event == "rename":
+        old_name, new_name = values
+        if old_name in tasks:
+            tasks.setdefault(new_name, []).extend(tasks.pop(old_name))
+            if old_name in tasks.archived:
+                tasks.archived[new_name] = tasks.archived.get(new_name, 0) + tasks.archived.pop(old_name)
+        return
+    name, *timestamps = values
+    timestamps = [parse_timestamp(t) if t else None for t in timestamps]
+    records = tasks.setdefault(name, [])
+    if event == "start":
+        start, = timestamps
+        if [start, None] not in records:  # A task runs at most once, a stopped record may start in the same second
+            records.append([start, None])
+    elif event == "stop":
+        start, end = timestamps
+        for r in records:
+            if r[0] == start and r[1] is None:
+                r[1] = end
+                break
+    elif event == "edit":
+        old_start, old_end, new_start, new_end = timestamps
+        for r in records:
+            if r == [old_start, old_end]:
+                r[:] = [new_start, new_end]
+                break
+    elif event == "add":
+        records.append(timestamps)
+    elif event == "delete":
+        if timestamps in records:
+            records.remove(timestamps)
+
+
+@timed("compact")
+def compact(file_name):
+    """
+    Fold the journal into the file by rewriting the whole file once. Returns False if the file didn't change.
+    The journal is only locked while it is renamed to the compacting journal, changes made while that one is folded
+    in go to a new journal. Right before the new file replaces the old one, its checksum is appended to the compacting
+    journal as a "folded" line. If rata crashes before deleting it, replaying it then skips the events the file has.
+    """
+    with file_lock(file_name, "compact"):
+        return _compact(file_name)
+
+
+def _compact(file_name):
+    """compact() for callers holding the "compact" lock. A compacting journal left by a crash is folded in first."""
+    compacting = compacting_name(file_name)
+    changed = False
+    while True:
+        with file_lock(file_name, "journal"):
+            left_over = os.path.exists(compacting)
+            if not left_over:
+                if not os.path.exists(journal_name(file_name)):
+                    return changed
+                os.replace(journal_name(file_name), compacting)
+        tasks = read_file(file_name, [compacting])
+        changed = write_file(tasks, file_name, lambda new_file: _append(compacting, ["folded", checksum(new_file)])) \
+            or changed
+        save_cache(file_name, to_columns(tasks))
+        os.unlink(compacting)
+        if not left_over:
+            return changed
+
+
+def expand_paths(paths):
+    """Replace folders by the logbooks in them."""
+    file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_names += sorted(os.path.join(path, f) for f in os.listdir(path)
+                                 if not f.startswith(".") and not f.endswith(".journal")
+                                 and os.path.isfile(os.path.join(path, f)))
+        else:
+            file_names.append(path)
+    return file_names
 
 
 def format_record(start, end):
@@ -61,12 +411,50 @@ def format_duration(my_timedelta):
     return duration
 
 
+def format_archived(seconds):
+    """Seconds moved to archive files as hours:minutes:seconds, hours not limited to a day."""
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def parse_archived(line):
+    """Seconds of an `ARCHIVED: 1234:56:07` line."""
+    hours, minutes, seconds = (int(value) for value in line[len("ARCHIVED:"):].strip().split(":"))
+    if minutes > 59 or seconds > 59 or min(hours, minutes, seconds) < 0:
+        raise ValueError(line)
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, datetime_format)
+
+
 def parse_line(line):
     """
-    Parse lines with a start/end timestamp to datetime records.
-    CLOCK: [2020-12-11 Fr 10:26]--[2020-12-11 Fr 12:00] => 01:34
-    or also: [2020-12-11 Fr 10:26]--[2020-12-11 Fr 12:00] => 01:34
+    Parse lines with a start/end timestamp to datetime records, raise ValueError if that fails.
+    CLOCK: [2020-12-27 10:22:10] -- [2020-12-27 11:30:11]
+    or also: [2020-12-27 10:22:10] -- [running]
     """
+    try:
+        return _parse_fixed_width(line)
+    except (ValueError, IndexError):
+        return _parse_any_width(line)
+
+
+def _parse_fixed_width(line):
+    """Fast path slicing the timestamps out of lines the way format_record writes them."""
+    i = line.index("[")
+    if line[i + 20:i + 26] != "] -- [":
+        raise ValueError(line)
+    start = datetime.fromisoformat(line[i + 1:i + 20])
+    if line[i + 26:i + 33] == "running":
+        return start, None
+    if line[i + 45] != "]":
+        raise ValueError(line)
+    return start, datetime.fromisoformat(line[i + 26:i + 45])
+
+
+def _parse_any_width(line):
+    """Slower fallback for hand-edited lines with extra whitespace."""
     _, start, end = line.split("[")
     start, _ = start.split("]")
     start = datetime.strptime(start, datetime_format)
@@ -78,8 +466,113 @@ def parse_line(line):
     return start, end
 
 
-def git_commit(file_name, message):
-    cmd = 'cd {} && git reset . && git add {} && git commit -m "rata: {}"'.format(
-        os.path.dirname(os.path.abspath(file_name)), file_name, message)
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    process.communicate()
+def combine_messages(messages):
+    """Join commit messages into one, repeated messages like many single-minute edits are counted instead."""
+    combined = []
+    for message, group in groupby(messages):
+        count = len(list(group))
+        combined.append(message if count == 1 else "{} ({}x)".format(message, count))
+    return "; ".join(combined)
+
+
+class CommitQueue(object):
+    """
+    Folds the journal into the file and commits in a background thread so the UI never waits for either. Changes
+    following each other within `delay` seconds end up in a single commit with a combined message.
+    """
+
+    def __init__(self, delay=None, backend=None):
+        self.delay = float(os.getenv("RATA_COMMIT_DELAY", 5)) if delay is None else delay
+        self.backend = backend or commit_backend()
+        self._committing = threading.Lock()  # Held while a batch is committed, the backend isn't thread-safe
+        self._condition = threading.Condition()
+        self._queued = {}  # file name -> messages waiting for the next commit
+        self._failed = {}  # file name -> messages of commits git refused, retried with the next commit of that file
+        # file name -> file_state before and after the journal was folded into it, see TaskManager.reload
+        self.compacted = {}
+        self._last_put = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        with self._condition:
+            return sum(len(m) for m in self._queued.values())
+
+    @property
+    def failed(self):
+        with self._condition:
+            return sum(len(m) for m in self._failed.values())
+
+    def put(self, file_name, message):
+        with self._condition:
+            self._queued.setdefault(file_name, []).append(message)
+            self._last_put = time.monotonic()
+            self._condition.notify()
+
+    def flush(self):
+        """Commit everything queued right away in the calling thread, once a batch the worker commits is done."""
+        with self._committing:
+            with self._condition:
+                batch, self._queued = self._queued, {}
+                for file_name in self._failed:
+                    batch.setdefault(file_name, [])
+            self._commit(batch)
+
+    def close(self):
+        """Stop the worker and commit what is left. Called on quit and on crash."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+        self.backend.close()
+
+    def _run(self):
+        while self._wait():
+            with self._committing:
+                with self._condition:  # Empty if flush() took the batch meanwhile
+                    batch, self._queued = self._queued, {}
+                self._commit(batch)
+
+    def _wait(self):
+        """Wait until changes are queued and `delay` seconds passed since the last one. Returns False once closed."""
+        with self._condition:
+            while not self._closed:
+                if not self._queued:
+                    self._condition.wait()
+                    continue
+                remaining = self._last_put + self.delay - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                return True
+            return False
+
+    def _commit(self, batch):
+        for file_name, messages in batch.items():
+            with self._condition:
+                failed = self._failed.pop(file_name, [])
+            messages = failed + messages
+            try:
+                with file_lock(file_name, "compact"):
+                    before = file_state(file_name)
+                    changed = _compact(file_name)
+                    if changed:
+                        self._note_compacted(file_name, before, file_state(file_name))
+            except Exception:
+                committed = False
+            else:
+                # Nothing to commit if the changes cancelled out, e.g. a rename to the same name
+                committed = (not changed and not failed) or self.backend.commit(file_name, combine_messages(messages))
+            if not committed:
+                with self._condition:
+                    self._failed.setdefault(file_name, [])[:0] = messages
+
+    def _note_compacted(self, file_name, before, after):
+        """Remember how the file changed, chaining up rewrites following each other."""
+        earlier = self.compacted.get(file_name)
+        if earlier is not None and earlier[1] == before:
+            before = earlier[0]
+        self.compacted[file_name] = (before, after)
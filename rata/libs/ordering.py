@@ -0,0 +1,44 @@
+from bisect import bisect_left
+
+
+class TaskOrder(object):
+    """
+    Keeps tasks sorted by a key, the way IntervalIndex keeps records sorted by start. When a task changes only that task
+    is moved to its new place, found by bisection, instead of sorting all tasks again. Moving a task is still O(n) as
+    list.insert and del shift the tasks after it, only finding its place is O(log n). Keys have to be unique, e.g. by
+    ending in id(task), so tasks themselves are never compared.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._keys = []  # (key, task), sorted
+        self._indexed = {}  # task -> key it is currently sorted by
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return (task for _, task in self._keys)
+
+    def __contains__(self, task):
+        return task in self._indexed
+
+    def update(self, task):
+        """Add the task, or move it if its key changed."""
+        key = self.key(task)
+        old_key = self._indexed.get(task)
+        if old_key == key:
+            return
+        if old_key is not None:
+            del self._keys[bisect_left(self._keys, (old_key,))]
+        self._keys.insert(bisect_left(self._keys, (key,)), (key, task))
+        self._indexed[task] = key
+
+    def discard(self, task):
+        key = self._indexed.pop(task, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, (key,))]
+
+    def bisect(self, key):
+        """Position a task with the given key would be inserted at."""
+        return bisect_left(self._keys, (key,))
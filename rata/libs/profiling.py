@@ -0,0 +1,103 @@
+"""
+Opt-in timing of the paths that can make rata feel slow: parsing, writing, commits, overlap checks and screen updates.
+Set $RATA_PROFILE to the name of a JSON file the timings are written to on exit, press P on the main screen to see them
+while running. $RATA_CPROFILE additionally writes cProfile statistics of the main thread to the given file.
+Without $RATA_PROFILE functions are not wrapped at all, so there is nothing to pay for.
+"""
+import atexit
+from collections import deque
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+output_name = os.getenv("RATA_PROFILE")
+cprofile_name = os.getenv("RATA_CPROFILE")
+enabled = bool(output_name)
+window = 1000  # Percentiles are taken over this many most recent calls of a span
+
+spans = {}  # name -> Span
+_lock = threading.Lock()  # Commits are timed in the background thread
+_profiler = None
+
+
+class Span(object):
+    """Durations of all calls of one function, keeping only the most recent ones for percentiles."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        return {"count": self.count, "total": self.total, "p50": recent[len(recent) // 2],
+                "p95": recent[min(len(recent) - 1, len(recent) * 95 // 100)], "max": self.max}
+
+
+def record(name, seconds):
+    with _lock:
+        if name not in spans:
+            spans[name] = Span()
+        spans[name].add(seconds)
+
+
+def timed(name):
+    """Decorator recording the duration of every call under name. Returns the function itself if profiling is off."""
+    def decorator(function):
+        if not enabled:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - began)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """Return dict of span name -> count, total, p50, p95 and max in seconds."""
+    with _lock:
+        return {name: span.summary() for name, span in sorted(spans.items())}
+
+
+def format_summary():
+    """Timings as a table in milliseconds, for the debug overlay."""
+    lines = ["{:<24} {:>7} {:>9} {:>9} {:>9}".format("span", "calls", "p50 ms", "p95 ms", "max ms")]
+    for name, values in summary().items():
+        lines.append("{:<24} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            name, values["count"], values["p50"] * 1000, values["p95"] * 1000, values["max"] * 1000))
+    return "\n".join(lines)
+
+
+def start():
+    """Called once on start. Begins cProfile if asked for and writes the results on exit."""
+    global _profiler
+    if cprofile_name:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if enabled or cprofile_name:
+        atexit.register(_stop)
+
+
+def _stop():
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(cprofile_name)
+    if enabled:
+        with open(output_name, "w") as output_file:
+            json.dump(summary(), output_file, indent=2)
+            output_file.write("\n")
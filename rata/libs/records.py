@@ -0,0 +1,82 @@
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+RUNNING = -1 << 63  # Stored as end of a record that is still running
+SECONDS_PER_DAY = 86400
+
+
+def to_epoch(moment):
+    """Seconds since 1970 of a naive timestamp. No timezone conversion happens, so differences stay exact."""
+    return ((moment.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+            + moment.hour * 3600 + moment.minute * 60 + moment.second)
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class Logbook(dict):
+    """
+    Tasks as read from a file, task name -> records or columns. archived holds task name -> seconds of the records
+    moved out of the file into archive files, see archive.py.
+    """
+
+    def __init__(self, *args, archived=None):
+        super().__init__(*args)
+        self.archived = {} if archived is None else archived
+
+
+class RecordStore(object):
+    """
+    Start and end time of all records as two columns of epoch seconds, plus the task each record belongs to. A record is
+    identified by its row number which never changes while the record exists, Record objects are only views on a row
+    created when needed. Rows of records taken out for good are freed and used again for records added later.
+    """
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.tasks = []
+        self.free_rows = []
+
+    def __len__(self):
+        return len(self.starts) - len(self.free_rows)
+
+    def append(self, task, start, end=RUNNING):
+        """Add a record given as epoch seconds and return its row number."""
+        if end != RUNNING:
+            assert start <= end, "Assert {} <= {}".format(from_epoch(start), from_epoch(end))
+        if self.free_rows:
+            row = self.free_rows.pop()
+            self.starts[row], self.ends[row], self.tasks[row] = start, end, task
+            return row
+        self.starts.append(start)
+        self.ends.append(end)
+        self.tasks.append(task)
+        return len(self.starts) - 1
+
+    def extend(self, task, starts, ends):
+        """Add many records given as arrays or memoryviews of epoch seconds and return their row numbers."""
+        reused = min(len(self.free_rows), len(starts))
+        rows = [self.free_rows.pop() for _ in range(reused)]
+        for row, start, end in zip(rows, starts, ends):
+            self.starts[row], self.ends[row], self.tasks[row] = start, end, task
+        first = len(self.starts)
+        # Copied as bytes at once, starts and ends may be memoryviews of the cache file, see cache.load_cache
+        self.starts.frombytes(memoryview(starts[reused:]).cast("B"))
+        self.ends.frombytes(memoryview(ends[reused:]).cast("B"))
+        self.tasks.extend([task] * (len(starts) - reused))
+        return rows + list(range(first, len(self.starts)))
+
+    def free(self, rows):
+        """Give back the rows of records taken out for good, forgetting their task."""
+        for row in rows:
+            self.tasks[row] = None
+        self.free_rows.extend(rows)
+
+    def end(self, row, now):
+        """End of the record with running records ending at `now`."""
+        end = self.ends[row]
+        return now if end == RUNNING else end
@@ -0,0 +1,127 @@
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from datetime import date, datetime, timedelta
+from itertools import repeat
+import json
+import os
+import sys
+
+from .archive import archive_names
+from .exceptions import ParseError
+from .io import expand_paths, format_duration, has_journal, iter_records, read_file
+from .records import EPOCH_ORDINAL, SECONDS_PER_DAY, from_epoch, to_epoch
+from .rollup import DayRollup
+
+groupings = {
+    "task": lambda task, day: task,
+    "day": lambda task, day: day.strftime("%Y-%m-%d"),
+    "week": lambda task, day: "{}-W{:02d}".format(*day.isocalendar()[:2]),
+    "month": lambda task, day: day.strftime("%Y-%m"),
+}
+
+
+def records(file_name):
+    """Yield (task name, start, end) of all records, streaming the file unless a journal has to be replayed first."""
+    if has_journal(file_name):
+        for task, task_records in read_file(file_name).items():
+            for start, end in task_records:
+                yield task, start, end
+        return
+    for task, start, end in iter_records(file_name):
+        if start is not None:
+            yield task, start, end
+
+
+def aggregate(file_name, by="task", since=None, until=None):
+    """
+    Sum up seconds per task or per period of a single file and its archive files, optionally only between two dates.
+    Records are summed up per task and day, split at midnight, only these sums are kept in memory, not the records.
+    """
+    key = groupings[by]
+    now = to_epoch(datetime.now())
+    rollups = defaultdict(DayRollup)
+    for name in [file_name] + archive_names(file_name):
+        for task, start, end in records(name):
+            rollups[task].add(to_epoch(start), to_epoch(end) if end else now)
+    first_day = -sys.maxsize if since is None else since.toordinal() - EPOCH_ORDINAL
+    last_day = sys.maxsize if until is None else until.toordinal() - EPOCH_ORDINAL
+    totals = defaultdict(int)
+    for task, rollup in rollups.items():
+        if by == "task":
+            totals[task] += rollup.between(first_day, last_day)
+            continue
+        for day, seconds in rollup.seconds.items():
+            if first_day <= day <= last_day:
+                totals[key(task, from_epoch(day * SECONDS_PER_DAY))] += seconds
+    return dict(totals)
+
+
+def aggregate_all(file_names, by="task", since=None, until=None):
+    """Yield (file name, totals) for each file, using a process per CPU if there are several files."""
+    if len(file_names) < 2:
+        for file_name in file_names:
+            yield file_name, aggregate(file_name, by, since, until)
+        return
+    with ProcessPoolExecutor() as pool:
+        yield from zip(file_names, pool.map(aggregate, file_names, repeat(by), repeat(since), repeat(until)))
+
+
+def rows(results, rate=None):
+    """Yield one dict per file and task or period, followed by a total per file."""
+    for file_name, totals in results:
+        for key in sorted(totals):
+            yield _row(file_name, key, totals[key], rate)
+        yield _row(file_name, "Total", sum(totals.values()), rate)
+
+
+def _row(file_name, key, seconds, rate):
+    row = {"file": file_name, "key": key, "seconds": seconds, "hours": round(seconds / 3600, 2)}
+    if rate:
+        row["amount"] = round(seconds / 3600 * rate, 2)
+    return row
+
+
+def write_table(rows, output):
+    rows = list(rows)
+    lines = [[r["file"], r["key"], format_duration(timedelta(seconds=r["seconds"]))]
+             + (["{:.2f} €".format(r["amount"])] if "amount" in r else []) for r in rows]
+    widths = [max([len(line[i]) for line in lines], default=0) for i in range(len(lines[0]) if lines else 0)]
+    for line in lines:
+        output.write("  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip() + "\n")
+
+
+def write_csv(rows, output):
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(output, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def write_json(rows, output):
+    json.dump(list(rows), output, indent=2, ensure_ascii=False)
+    output.write("\n")
+
+
+writers = {"table": write_table, "csv": write_csv, "json": write_json}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="rata report", description="Sum up tracked time without starting the UI.")
+    parser.add_argument("files", nargs="+", help="rata files or folders of rata files")
+    parser.add_argument("--by", choices=list(groupings), default="task", help="sum up per task or per period")
+    parser.add_argument("--format", choices=list(writers), default="table")
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to sum up, as YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, help="last day to sum up, as YYYY-MM-DD")
+    parser.add_argument("--rate", type=float, default=os.getenv("RATE"), help="hourly rate, defaults to $RATE")
+    options = parser.parse_args(args)
+    try:
+        results = aggregate_all(expand_paths(options.files), options.by, options.since, options.until)
+        writers[options.format](rows(results, options.rate), sys.stdout)
+    except (ParseError, FileNotFoundError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
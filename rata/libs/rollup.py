@@ -0,0 +1,75 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from .records import EPOCH_ORDINAL, RUNNING, SECONDS_PER_DAY
+
+periods = ["today", "this week", "this month", "this year"]
+
+
+def period_range(period, today):
+    """First and last day, as days since 1970, of the period containing the date today."""
+    if period == "today":
+        first = last = today
+    elif period == "this week":
+        first = today - timedelta(days=today.weekday())
+        last = first + timedelta(days=6)
+    elif period == "this month":
+        first = today.replace(day=1)
+        last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    elif period == "this year":
+        first, last = today.replace(month=1, day=1), today.replace(month=12, day=31)
+    else:
+        raise Exception("unexpected period")
+    return first.toordinal() - EPOCH_ORDINAL, last.toordinal() - EPOCH_ORDINAL
+
+
+class DayRollup(object):
+    """
+    Seconds tracked per day, with records crossing midnight split between the days. Sums over a range of days are
+    answered by bisecting prefix sums over the days, which are built again on the first query after a change.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(int)  # day since 1970 -> seconds
+        self._days = None  # Days with seconds, sorted
+        self._prefix = None  # _prefix[i] is the sum of all days before _days[i]
+
+    def add(self, start, end, sign=1):
+        """Count the time between two epoch seconds, or with sign=-1 remove it again."""
+        day = start // SECONDS_PER_DAY
+        while end > (day + 1) * SECONDS_PER_DAY:
+            self.seconds[day] += ((day + 1) * SECONDS_PER_DAY - start) * sign
+            day += 1
+            start = day * SECONDS_PER_DAY
+        if end > start:
+            self.seconds[day] += (end - start) * sign
+        self._days = None
+
+    def extend(self, starts, ends):
+        """Count many records given as columns of epoch seconds, skipping running ones."""
+        seconds = self.seconds
+        for start, end in zip(starts, ends):
+            if end == RUNNING:
+                continue
+            day = start // SECONDS_PER_DAY
+            if end <= (day + 1) * SECONDS_PER_DAY:  # Most records don't cross midnight
+                seconds[day] += end - start
+            else:
+                self.add(start, end)
+        self._days = None
+
+    def merge(self, other, sign=1):
+        """Add the seconds counted by another rollup, or with sign=-1 remove them."""
+        for day, seconds in other.seconds.items():
+            self.seconds[day] += seconds * sign
+        self._days = None
+
+    def between(self, first_day, last_day):
+        """Seconds from the start of first_day up to the end of last_day."""
+        if self._days is None:
+            self._days = sorted(self.seconds)
+            self._prefix = [0]
+            for day in self._days:
+                self._prefix.append(self._prefix[-1] + self.seconds[day])
+        return self._prefix[bisect_right(self._days, last_day)] - self._prefix[bisect_left(self._days, first_day)]
@@ -0,0 +1,154 @@
+"""
+Answers `rata status`, `rata start <task>`, `rata stop` and `rata switch <task>` when no daemon is running, without
+loading the records into a TaskManager. What runs, the latest end and the seconds tracked per task and per day are kept
+as a small summary of each file in the cache folder. It is computed again only after the file or its journal changed,
+so a shell prompt asking for the status doesn't read the file at all. Replies look like the daemon's.
+"""
+from datetime import date, datetime
+import os
+
+from .cache import load_summary, save_summary
+from .exceptions import ParseError, RecordOverlap
+from .io import (append_journal, commit_backend, compact, datetime_format, expand_paths, file_state,
+                 is_inside_git_dir, journal_names, no_git_directory, read_columns)
+from .records import EPOCH_ORDINAL, RUNNING, SECONDS_PER_DAY, from_epoch, to_epoch
+from .rollup import DayRollup
+
+
+def _state(file_name):
+    """What the summary of a file is valid for: modification time and size of the file and of its journals."""
+    return [list(s) if s else None for s in map(file_state, [file_name] + journal_names(file_name))]
+
+
+def summarize(file_name):
+    """
+    Return the summary of a file, a dict of
+    tasks: task name -> seconds of stopped and archived records,
+    days: day since 1970 as str -> seconds of stopped records still in the file,
+    running: [task name, start] of the running record or None, latest_end: latest end of a stopped record or None.
+    """
+    state = _state(file_name)
+    summary = load_summary(file_name)
+    if summary is not None and summary.get("state") == state:
+        return summary
+    try:
+        columns = read_columns(file_name)
+    except FileNotFoundError:
+        columns = {}
+    rollup = DayRollup()
+    summary = {"state": state, "tasks": {}, "days": {}, "running": None, "latest_end": None}
+    archived = getattr(columns, "archived", {})
+    for name, (starts, ends) in columns.items():
+        task_rollup = DayRollup()
+        task_rollup.extend(starts, ends)
+        rollup.merge(task_rollup)
+        summary["tasks"][name] = sum(task_rollup.seconds.values()) + archived.get(name, 0)
+        if RUNNING in ends:
+            summary["running"] = [name, starts[ends.index(RUNNING)]]
+        if len(ends) and max(ends) != RUNNING:
+            summary["latest_end"] = max(summary["latest_end"] or RUNNING, max(ends))
+    summary["days"] = {str(day): seconds for day, seconds in rollup.seconds.items() if seconds}
+    save_summary(file_name, summary)
+    return summary
+
+
+def handle(command, path, task=None, file=None):
+    """Answer a command for the files of a path like the daemon would, see Daemon.handle."""
+    file_names = expand_paths([path])
+    unversioned = [f for f in file_names if command != "status" and not is_inside_git_dir(f)]
+    if unversioned:
+        return {"ok": False, "error": no_git_directory.format(unversioned[0])}
+    try:
+        summaries = {f: summarize(f) for f in file_names}
+        if command == "start":
+            if _running(summaries) is not None:
+                raise ValueError("{} is running already, use switch".format(_running(summaries)[1][0]))
+            _start(summaries, task, file)
+        elif command == "stop":
+            if _running(summaries) is None:
+                raise ValueError("Nothing is running")
+            _stop(summaries)
+        elif command == "switch":
+            if not task:
+                raise ValueError("No task given")
+            running = _running(summaries)
+            if running is not None and running[1][0] == task and running[0] in _candidates(summaries, file):
+                pass  # Running already, stopping and starting it again would only split its record
+            else:
+                if running is not None:
+                    _stop(summaries)
+                _start(summaries, task, file)
+    except (ValueError, RecordOverlap, ParseError) as e:
+        return {"ok": False, "error": str(e)}
+    reply = status(summaries)
+    reply["ok"] = True
+    return reply
+
+
+def status(summaries):
+    """What is running since when, and the time tracked today."""
+    now = to_epoch(datetime.now())
+    today = date.today().toordinal() - EPOCH_ORDINAL
+    reply = {"running": None, "today": 0}
+    for file_name, summary in summaries.items():
+        reply["today"] += summary["days"].get(str(today), 0)
+        if summary["running"] is None:
+            continue
+        name, start = summary["running"]
+        reply["today"] += max(0, now - max(start, today * SECONDS_PER_DAY))
+        if reply["running"] is None:
+            reply["running"] = {"file": file_name, "task": name, "since": from_epoch(start).strftime(datetime_format),
+                                "seconds": now - start, "task_seconds": summary["tasks"][name] + now - start}
+    return reply
+
+
+def _running(summaries):
+    """(file name, [task name, start]) of the running record, None if nothing runs."""
+    for file_name, summary in summaries.items():
+        if summary["running"] is not None:
+            return file_name, summary["running"]
+    return None
+
+
+def _candidates(summaries, file=None):
+    """Files of the summaries a task may be in, those of the given file or folder or all of them."""
+    return [f for f in summaries if file is None or os.path.abspath(f) in
+            {os.path.abspath(p) for p in expand_paths([file])}]
+
+
+def _start(summaries, name, file=None):
+    if not name:
+        raise ValueError("No task given")
+    candidates = _candidates(summaries, file)
+    if not candidates:
+        raise ValueError("{} is not one of the files given".format(file))
+    file_name = next((f for f in candidates if name in summaries[f]["tasks"]), None)
+    if file_name is None:
+        if len(candidates) != 1:
+            raise ValueError("No task named {}, name the file to add it to".format(name))
+        file_name = candidates[0]
+    start = from_epoch(to_epoch(datetime.now()))
+    _write(file_name, "{}: Start task".format(name[:30]), "start", name, start)
+    summaries[file_name] = summarize(file_name)  # From the cache compact() saved, as written to the file
+
+
+def _stop(summaries):
+    file_name, (name, start) = _running(summaries)
+    end = to_epoch(datetime.now())
+    for other_name, summary in summaries.items():  # Records never overlap, so only a later one can collide
+        if summary["latest_end"] is not None and summary["latest_end"] > start:
+            raise RecordOverlap("Overlapping records: {} runs since {}, a record of {} ends at {}".format(
+                name, from_epoch(start), os.path.basename(other_name), from_epoch(summary["latest_end"])))
+    _write(file_name, "{}: Stop task".format(name[:30]), "stop", name, from_epoch(start), from_epoch(end))
+    summaries[file_name] = summarize(file_name)
+
+
+def _write(file_name, message, *event):
+    """Append the event to the journal, fold it into the file and commit right away, as nothing runs in between."""
+    append_journal(file_name, event)
+    compact(file_name)
+    backend = commit_backend()
+    try:
+        backend.commit(file_name, message)  # If git fails the next commit of the file takes the change along
+    finally:
+        backend.close()
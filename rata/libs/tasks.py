@@ -1,25 +1,82 @@
-from datetime import datetime, timedelta
+from array import array
+from datetime import date, datetime, timedelta
+import os
 
-from .io import datetime_format, format_duration, read_file, write_file
+from .io import CommitQueue, append_journal, datetime_format, file_lock, file_state, format_duration, has_journal, read_columns
 from .exceptions import RecordOverlap
+from .intervals import IntervalIndex
+from .ordering import TaskOrder
+from .profiling import timed
+from .records import RUNNING, SECONDS_PER_DAY, RecordStore, from_epoch, to_epoch
+from .rollup import DayRollup, period_range
+
+STALE = object()  # Task.latest_end has to be looked up again
 
 
 class Record(object):
+    """View on a single row of the TaskManager's RecordStore."""
+    __slots__ = ("store", "id")
+
+    def __init__(self, store, record_id):
+        self.store = store
+        self.id = record_id
 
-    def __init__(self, task, start=None, end=None):
-        self.task = task
-        if start and end:
-            assert start <= end, "Assert {} <= {}".format(start, end)
-        self.start = start or datetime.now().replace(microsecond=0)
-        self.end = end
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.store is other.store and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
 
     def __repr__(self):
         return "<Record {}: {} -- {}>".format(self.task.name, self.start, self.end or "running")
 
+    @property
+    def task(self):
+        return self.store.tasks[self.id]
+
+    @property
+    def start(self):
+        return from_epoch(self.store.starts[self.id])
+
+    @start.setter
+    def start(self, value):
+        self._set(to_epoch(value), self.store.ends[self.id])
+
+    @property
+    def end(self):
+        end = self.store.ends[self.id]
+        return None if end == RUNNING else from_epoch(end)
+
+    @end.setter
+    def end(self, value):
+        self._set(self.store.starts[self.id], RUNNING if value is None else to_epoch(value))
+
+    def _set(self, start, end):
+        """Change start/end time while keeping the task manager's index and totals in line."""
+        taskmanager = self.task.taskmanager
+        store = self.store
+        if self.id not in taskmanager.intervals:
+            store.starts[self.id], store.ends[self.id] = start, end
+            return
+        taskmanager.count(self.id, -1)
+        if start != store.starts[self.id]:
+            taskmanager.intervals.discard(self.id)
+            store.starts[self.id], store.ends[self.id] = start, end
+            taskmanager.intervals.add(self.id)
+        else:
+            store.ends[self.id] = end
+        taskmanager.count(self.id)
+        taskmanager.reorder(self.task)
+
     def stop(self):
         assert not self.end
         self.end = datetime.now().replace(microsecond=0)
 
+    def save(self, old_start, old_end):
+        """Persist a change of start/end time."""
+        self.task.write("{}: Change record".format(self.task.name[:30]),
+                        "edit", self.task.name, old_start, old_end, self.start, self.end)
+
     @property
     def duration(self):
         return (self.end or datetime.now().replace(microsecond=0)) - self.start
@@ -41,12 +98,31 @@ class Record(object):
 
 
 class Task(object):
-    button = None
 
-    def __init__(self, taskmanager, name, timerecords=None):
+    def __init__(self, taskmanager, name, columns=None):
         self.taskmanager = taskmanager
         self.name = name
-        self.records = [Record(self, r[0], r[1]) for r in timerecords] or []
+        self.record_ids = array("q")  # Rows of this task's records in the TaskManager's RecordStore
+        self.closed_seconds = 0  # Sum of all stopped records, kept up to date by TaskManager.count
+        self.archived_seconds = 0  # Sum of the records moved to archive files, see TaskManager.carry
+        self.rollup = DayRollup()  # Stopped records per day, also kept up to date by TaskManager.count
+        self.running_records = []
+        self.unloaded = None  # (starts, ends) read from the file but not added to the store yet, see load()
+        self.unloaded_span = None  # Earliest start and latest end of the unloaded records
+        self._latest_end = None
+        if columns and columns[0]:
+            self.read(*columns)
+
+    def read(self, starts, ends):
+        """Take records read from the file, only counting them until they are loaded."""
+        self.taskmanager.summarize(self, starts, ends)
+        self.unloaded = starts, ends
+        self.unloaded_span = min(starts), max(ends)
+        self._latest_end = None if self.unloaded_span[1] == RUNNING else self.unloaded_span[1]
+
+    def load(self):
+        """Add the records read from the file to the TaskManager's store and overlap index, if not done yet."""
+        self.taskmanager.load([self])
 
     def __radd__(self, other):
         if other == 0:
@@ -57,26 +133,41 @@ class Task(object):
         return "<Task: {}>".format(self.name)
 
     def start(self):
-        self.records.append(Record(self))
-        self.write("{}: Start task".format(self.name[:30]))
+        record_id = self.taskmanager.insert(self, to_epoch(datetime.now().replace(microsecond=0)))
+        record = Record(self.taskmanager.store, record_id)
+        self.write("{}: Start task".format(self.name[:30]), "start", self.name, record.start)
 
     def stop(self):
-        for r in self.records:
-            if r.is_running:
-                r.stop()
-                break
-        else:
+        r = self.running_record
+        if not r:
             raise Exception("Not running")
-        self.taskmanager.check_for_overlapping()
-        self.write("{}: Stop task".format(self.name[:30]))
-        self.button.attr_map = {None: "normal"}
+        r.stop()
+        self.taskmanager.check_for_overlapping(r)
+        self.write("{}: Stop task".format(self.name[:30]), "stop", self.name, r.start, r.end)
+
+    def rename(self, new_name):
+        if new_name == self.name:
+            return
+        old_name = self.name
+        self.name = new_name
+        del self.taskmanager.tasks_by_name[old_name]
+        self.taskmanager.tasks_by_name[new_name] = self
+        self.taskmanager.reorder(self)
+        self.write("{}: Rename to '{}'".format(old_name, new_name), "rename", old_name, new_name)
+
+    def write(self, message, *event):
+        self.taskmanager.write(message, *event)
 
-    def write(self, message=""):
-        self.taskmanager.write(message)
+    @property
+    def records(self):
+        self.load()
+        store = self.taskmanager.store
+        return [Record(store, i) for i in self.record_ids]
 
     @property
     def duration(self):
-        return sum([r.duration for r in self.records], timedelta())
+        return (timedelta(seconds=self.closed_seconds + self.archived_seconds)
+                + sum([r.duration for r in self.running_records], timedelta()))
 
     @property
     def label(self):
@@ -84,94 +175,369 @@ class Task(object):
 
     @property
     def is_running(self):
-        return any([r.is_running for r in self.records])
+        return bool(self.running_records)
 
     @property
     def most_recent(self):
-        default = datetime(year=9999, month=1, day=1)
-        return max([r.end or default for r in self.records], default=datetime(year=1, month=1, day=1))
+        if self.running_records:
+            return datetime(year=9999, month=1, day=1)
+        latest = self.latest_end
+        return datetime(year=1, month=1, day=1) if latest is None else from_epoch(latest)
+
+    @property
+    def latest_end(self):
+        """End of the task's last stopped record in epoch seconds, None if it has none."""
+        if self._latest_end is STALE:
+            ends = self.taskmanager.store.ends
+            latest = max([ends[i] for i in self.record_ids if ends[i] != RUNNING], default=None)
+            if self.unloaded_span and self.unloaded_span[1] != RUNNING:
+                latest = max(latest or RUNNING, self.unloaded_span[1])
+            self._latest_end = latest
+        return self._latest_end
+
+    def count_end(self, end, sign):
+        """Keep latest_end in line with a stopped record being added (sign=1) or removed (sign=-1)."""
+        if sign > 0:
+            if self._latest_end is not STALE and (self._latest_end is None or end > self._latest_end):
+                self._latest_end = end
+        elif end == self._latest_end:
+            self._latest_end = STALE  # The record before it is only looked for when needed
 
     @property
     def running_record(self):
-        for r in self.records:
-            if r.is_running:
-                return r
-        return None
+        return self.running_records[0] if self.running_records else None
+
+
+def by_duration(task):
+    return -int(task.duration.total_seconds()), task.name.lower(), id(task)
+
+
+def by_most_recent(task):
+    latest = task.latest_end
+    return not task.is_running, -(RUNNING if latest is None else latest), task.name.lower(), id(task)
+
+
+sort_keys = {
+    "name": lambda task: (task.name.lower(), id(task)),
+    "duration": by_duration,
+    "most recent": by_most_recent,
+}
 
 
 class TaskManager(object):
-    tasks = []
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, lazy=False, workspace=None, columns=None):
+        """
+        Read all tasks from the file. With lazy=True only their totals are computed at first, records of a task are
+        added to the store when it is edited or may overlap a changed record. Records written before are then trusted
+        to not overlap, instead of checking them all at start.
+        As part of a Workspace the store, overlap index and commit queue are shared with the other files, which the
+        workspace then checks for overlaps all at once. columns are the tasks as returned by read_columns if they were
+        read already.
+        """
         self.file_name = file_name
-        try:
-            raw_tasks = read_file(file_name)
-        except FileNotFoundError:
-            pass
+        self.workspace = workspace
+        self.tasks = []
+        self.tasks_by_name = {}
+        if workspace is None:
+            self.store = RecordStore()
+            self.intervals = IntervalIndex(self.store)
+            self.committer = CommitQueue()
         else:
-            for name, timerecords in raw_tasks.items():
-                self.tasks.append(Task(self, name, timerecords))
-        self.check_for_overlapping()
+            self.store = workspace.store
+            self.intervals = workspace.intervals
+            self.committer = workspace.committer
+        self.closed_seconds = 0
+        self.archived_seconds = 0
+        self.rollup = DayRollup()  # Stopped records of all tasks per day
+        self.running_records = []
+        self.orders = {sort_order: TaskOrder(key) for sort_order, key in sort_keys.items()}
+        self.file_state = file_state(file_name)  # To notice changes made by others, see reload()
+        if columns is None:
+            try:
+                columns = read_columns(file_name)
+            except FileNotFoundError:
+                columns = {}
+        archived = getattr(columns, "archived", {})
+        for name, (starts, ends) in columns.items():
+            task = Task(self, name, (starts, ends))
+            self.carry(task, archived.get(name, 0))
+            self.tasks.append(task)
+            self.tasks_by_name[name] = task
+            self.reorder(task)
+        self.load([t for t in self.tasks if not lazy or t.unloaded and RUNNING in t.unloaded[1]])
+        if not lazy and workspace is None:
+            self.check_for_overlapping()
+        if has_journal(file_name):  # Left over from a crash, fold it in with the next commit
+            self.committer.put(file_name, "Recover journal")
 
     def tasks_by(self, sort_order="name"):
-        if sort_order == "name":
-            self.tasks.sort(key=lambda t: t.name.lower())
-        elif sort_order == "duration":
-            self.tasks.sort(key=lambda t: t.duration, reverse=True)
-        elif sort_order == "most recent":
-            self.tasks.sort(key=lambda t: t.most_recent, reverse=True)
-        else:
+        """Return a list of the tasks in the given order, read from indexes that are kept sorted as tasks change."""
+        if sort_order not in self.orders:
             raise Exception("unexpected sort_order")
-        return self.tasks
+        order = self.orders[sort_order]
+        tasks = list(order)
+        if sort_order == "duration":  # Running tasks grow every second, so they are placed only when asked for
+            running = sorted({r.task for r in self.running_records}, key=by_duration, reverse=True)
+            for task in running:
+                tasks.insert(order.bisect(by_duration(task)), task)
+        return tasks
+
+    def reorder(self, task):
+        """Move a task that was added or changed to its place in each sort order."""
+        for sort_order, order in self.orders.items():
+            if sort_order == "duration" and task.is_running:
+                order.discard(task)
+            else:
+                order.update(task)
 
     def add(self, name):
-        new_task = None
-        for t in self.tasks:
-            if t.name == name:
-                new_task = t
-                break
-        if not new_task:
-            new_task = Task(self, name, [])
-            self.tasks.append(new_task)
-        return new_task
-
-    def check_for_overlapping(self):
-        flattened_records = []
-        # Flat list of all timerecords but with last item in each timerecord being the task so we can show which two
-        # tasks collide.
-        [flattened_records.extend([[r.start, r.end or datetime.now(), t]
-                                  for r in t.records]) for t in self.tasks]
-        for f in flattened_records:
-            all_others = flattened_records[:]
-            all_others.remove(f)
-            for o in all_others:
-                latest_start = max(f[0], o[0])
-                earliest_end = min(f[1], o[1])
-                delta = (earliest_end - latest_start)
-                if delta.total_seconds() > 0:
-                    raise RecordOverlap("Overlapping records:\n{:50.50s} {} -- {}\n{:50.50s} {} -- {}".format(
-                        o[2].name, o[0], o[1], f[2].name, f[0], f[1]))
+        """Return the task of that name, adding it if there is none."""
+        task = self.tasks_by_name.get(name)
+        if task is None:
+            task = Task(self, name, [])
+            self.tasks.append(task)
+            self.tasks_by_name[name] = task
+            self.reorder(task)
+        return task
+
+    def summarize(self, task, starts, ends, sign=1):
+        """Add records read from the file to the cached totals, not to the store. sign=-1 removes them again."""
+        rollup = DayRollup()
+        rollup.extend(starts, ends)
+        closed = sum(rollup.seconds.values()) * sign
+        task.rollup.merge(rollup, sign)
+        self.rollup.merge(rollup, sign)
+        task.closed_seconds += closed
+        self.closed_seconds += closed
+
+    def carry(self, task, seconds):
+        """
+        Set the seconds of a task's records that were moved to archive files. They count towards the totals, not the
+        sums per period, and are never loaded or checked for overlaps.
+        """
+        self.archived_seconds += seconds - task.archived_seconds
+        task.archived_seconds = seconds
+
+    def replace(self, task, starts, ends):
+        """Swap all records of a task for the given ones, as read again from the file after someone changed it."""
+        for record_id in task.record_ids:
+            self.count(record_id, -1)
+            self.intervals.discard(record_id)
+        self.store.free(task.record_ids)
+        if task.unloaded is not None:
+            self.summarize(task, *task.unloaded, sign=-1)
+        task.record_ids = array("q")
+        task.unloaded = task.unloaded_span = task._latest_end = None
+        if len(starts):
+            task.read(starts, ends)
+        self.load([task])
+        self.reorder(task)
+
+    def reload(self):
+        """
+        Merge changes someone else made to the file, e.g. with an editor or by pulling from another machine. Only tasks
+        whose records differ are replaced, changed records are checked for overlaps. Returns whether anything changed.
+        Changes waiting in the journal stay on top, as reading the file replays them. While a journal is being folded into
+        the file this returns False right away, the next check picks the new file up.
+        """
+        with file_lock(self.file_name, "compact", wait=False) as locked:
+            if not locked:
+                return False
+            state = file_state(self.file_name)
+            if state == self.file_state or state is None:
+                return False
+            known, self.file_state = self.file_state, state
+            if self.committer.compacted.pop(self.file_name, None) == (known, state):
+                return False  # Only rewritten by the commit queue, which adds nothing the tasks don't have yet
+            columns = read_columns(self.file_name)
+        changed = []
+        archived = getattr(columns, "archived", {})
+        for name, (starts, ends) in columns.items():
+            task = self.tasks_by_name.get(name)
+            if task is None:
+                task = self.add(name)
+            elif (sorted(zip(starts, ends)) == sorted(self._columns(task))
+                  and task.archived_seconds == archived.get(name, 0)):
+                continue
+            self.carry(task, archived.get(name, 0))
+            self.replace(task, starts, ends)
+            changed.append(task)
+        for task in self.tasks[:]:
+            # Tasks added here have no records yet
+            if task.name not in columns and (task.record_ids or task.unloaded or task.archived_seconds):
+                self.carry(task, 0)
+                self.replace(task, [], [])
+                self.remove(task)
+                changed.append(task)
+        for task in changed:
+            for record in task.records:
+                self.check_for_overlapping(record)
+        return bool(changed)
+
+    def _columns(self, task):
+        """(start, end) of all records of a task, loaded or not."""
+        store = self.store
+        pairs = [(store.starts[i], store.ends[i]) for i in task.record_ids]
+        if task.unloaded is not None:
+            pairs += zip(*task.unloaded)
+        return pairs
+
+    def remove(self, task):
+        """Forget a task without records."""
+        self.tasks.remove(task)
+        del self.tasks_by_name[task.name]
+        for order in self.orders.values():
+            order.discard(task)
+
+    def insert(self, task, start, end=RUNNING):
+        """Add a record given as epoch seconds to a task and return its row number."""
+        record_id = self.store.append(task, start, end)
+        task.record_ids.append(record_id)
+        self.track(record_id)
+        return record_id
+
+    def track(self, record_id):
+        """Add a record to the overlap index and the cached totals."""
+        self.intervals.add(record_id)
+        self.count(record_id)
+        self.reorder(self.store.tasks[record_id])
+
+    def untrack(self, record_id):
+        """Take a record out of its task, the overlap index and the cached totals. Its row in the store stays unused."""
+        task = self.store.tasks[record_id]
+        self.count(record_id, -1)
+        self.intervals.discard(record_id)
+        task.record_ids.remove(record_id)
+        self.reorder(task)
+
+    def count(self, record_id, sign=1):
+        """Add (or with sign=-1 remove) a record to the cached totals. Running records are summed up live."""
+        store = self.store
+        task = store.tasks[record_id]
+        start, end = store.starts[record_id], store.ends[record_id]
+        if end == RUNNING:
+            record = Record(store, record_id)
+            if sign > 0:
+                task.running_records.append(record)
+                self.running_records.append(record)
+            else:
+                task.running_records.remove(record)
+                self.running_records.remove(record)
+            return
+        task.count_end(end, sign)
+        seconds = (end - start) * sign
+        task.closed_seconds += seconds
+        self.closed_seconds += seconds
+        task.rollup.add(start, end, sign)
+        self.rollup.add(start, end, sign)
+
+    @timed("check_for_overlapping")
+    def check_for_overlapping(self, *records):
+        """
+        Raise RecordOverlap if records collide. Given records that just changed only their neighbours are compared,
+        otherwise all records are checked in one sweep.
+        """
+        now = datetime.now()
+        epoch_now = to_epoch(now)
+        pair = None
+        if not records:
+            self.load_overlapping(None)
+            pair = self.intervals.sweep(epoch_now)
+        else:
+            store = self.store
+            self.load_overlapping((min(store.starts[r.id] for r in records),
+                                   max(store.end(r.id, epoch_now) for r in records)))
+            for record in records:
+                other = self.intervals.find_overlap(record.id, epoch_now)
+                if other is not None:
+                    pair = record.id, other
+                    break
+        if pair:
+            o, f = sorted([Record(self.store, i) for i in pair], key=lambda r: r.start)
+            o_name, f_name = o.task.name, f.task.name
+            if o.task.taskmanager is not f.task.taskmanager:  # Records of two files of a workspace
+                o_name = "{}: {}".format(os.path.basename(o.task.taskmanager.file_name), o_name)
+                f_name = "{}: {}".format(os.path.basename(f.task.taskmanager.file_name), f_name)
+            raise RecordOverlap("Overlapping records:\n{:50.50s} {} -- {}\n{:50.50s} {} -- {}".format(
+                o_name, o.start, o.end or now, f_name, f.start, f.end or now))
+
+    def load(self, tasks):
+        """Add records of tasks read from the file to the store and overlap index, sorting the index only once."""
+        record_ids = []
+        for task in tasks:
+            if task.unloaded is None:
+                continue
+            starts, ends = task.unloaded
+            task.unloaded = task.unloaded_span = None
+            task_record_ids = self.store.extend(task, starts, ends)
+            task.record_ids.extend(task_record_ids)
+            record_ids.extend(task_record_ids)
+        self.intervals.extend(record_ids)
+        for record_id in record_ids:
+            if self.store.ends[record_id] == RUNNING:
+                self.count(record_id)
+                self.reorder(self.store.tasks[record_id])
+
+    def load_overlapping(self, span):
+        """
+        Load all tasks that may have records overlapping the span of (start, end) epoch seconds, or all tasks if span
+        is None. In a workspace the tasks of all files are considered, as they share one overlap index.
+        """
+        taskmanagers = [self] if self.workspace is None else self.workspace.taskmanagers
+        for taskmanager in taskmanagers:
+            tasks = []
+            for task in taskmanager.tasks:
+                unloaded_span = task.unloaded_span
+                if unloaded_span is None:
+                    continue
+                if span is None or (unloaded_span[0] < span[1] and span[0] < unloaded_span[1]):
+                    tasks.append(task)
+            taskmanager.load(tasks)
 
     def find_running_task(self):
         """Return task that has no end time. Helps when program crashed while tracking and was restarted."""
-        for t in self.tasks:
-            if t.is_running:
-                return t
-        return None
+        record = self.running_record
+        return record.task if record else None
+
+    @property
+    def running_record(self):
+        """Record tracked right now. Records are added to running_records as they are started or loaded."""
+        return self.running_records[0] if self.running_records else None
+
+    def write(self, message, *event):
+        """Append event to the journal. The file itself is rewritten in the background before committing."""
+        append_journal(self.file_name, event)
+        self.committer.put(self.file_name, message)
 
-    def write(self, message=""):
-        write_file(self.tasks, self.file_name, message)
+    def close(self):
+        """Commit any changes still waiting in the queue. A workspace closes its shared queue itself."""
+        if self.workspace is None:
+            self.committer.close()
 
     @property
     def total_duration(self):
-        return sum(self.tasks) or timedelta(seconds=0)
+        return (timedelta(seconds=self.closed_seconds + self.archived_seconds)
+                + sum([r.duration for r in self.running_records], timedelta()))
 
     @property
     def todays_duration(self):
-        today = datetime.today().date()
-        today_duration = timedelta(seconds=0)
-        for t in self.tasks:
-            for r in t.records:
-                if r.start.date() == today:
-                    today_duration += r.duration
-        return today_duration
+        return self.period_duration("today")
+
+    def period_duration(self, period, task=None):
+        """
+        Time tracked today, this week, this month or this year, of all tasks or of a single task. Records moved to
+        archive files are not included, only their total per task is kept in the file.
+        """
+        return self.duration_between(*period_range(period, date.today()), task=task)
+
+    def duration_between(self, first_day, last_day, task=None):
+        """Time tracked from the start of first_day to the end of last_day, given as days since 1970."""
+        source = self if task is None else task
+        rollup, running_records = source.rollup, source.running_records
+        seconds = rollup.between(first_day, last_day)
+        now = to_epoch(datetime.now())
+        for record in running_records:  # Not in the rollup as they grow every second
+            start = max(self.store.starts[record.id], first_day * SECONDS_PER_DAY)
+            seconds += max(0, min(now, (last_day + 1) * SECONDS_PER_DAY) - start)
+        return timedelta(seconds=seconds)
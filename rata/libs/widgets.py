@@ -10,6 +10,7 @@ class TaskButtonWrap(urwid.WidgetWrap):
     """
     Button that adjusts label to terminal width
     https://stackoverflow.com/questions/41571349/change-button-label-on-screen-redraw-urwid
+    urwid keeps the rendered row until the width changes or the row is invalidated, e.g. by TaskWalker.update.
     """
     def __init__(self, task):
         self.task = task
@@ -25,13 +26,102 @@ class TaskButtonWrap(urwid.WidgetWrap):
         max_name_size = cols - 6 - len(timestamp)  # 6 = border size
         label_format = "{{:<{width}.{width}}} {{}}".format(width=max_name_size)
         label = label_format.format(name, timestamp)
-        self.button.set_label(label)
+        if label != self.button.label:  # Setting it invalidates the row, which would repaint it on every redraw
+            self.button.set_label(label)
         return super().render(size, *args, **kw)
 
     def set_label(self, label):
         self._w.set_label(label)
 
 
+class TaskWalker(urwid.ListWalker):
+    """
+    Rows of the main screen: header, one button per task and footer. A task's button is only created once its row is
+    shown and then kept, so resorting or starting/stopping a task does not rebuild any widgets.
+    """
+    def __init__(self, header, footer, on_click):
+        self.header = header
+        self.footer = footer
+        self.on_click = on_click
+        self.tasks = []
+        self.positions = {}  # task -> row
+        self.buttons = {}  # task -> button, for all rows shown so far
+        self.current = None
+        self.focus = len(header)
+
+    def __len__(self):
+        return len(self.header) + len(self.tasks) + len(self.footer)
+
+    def __getitem__(self, position):
+        if position < 0:
+            raise IndexError(position)
+        if position < len(self.header):
+            return self.header[position]
+        position -= len(self.header)
+        if position < len(self.tasks):
+            return self.button(self.tasks[position])
+        return self.footer[position - len(self.tasks)]
+
+    def next_position(self, position):
+        if position + 1 >= len(self):
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    @property
+    def focus_task(self):
+        row = self.focus - len(self.header)
+        return self.tasks[row] if 0 <= row < len(self.tasks) else None
+
+    def button(self, task):
+        button = self.buttons.get(task)
+        if button is None:
+            wrap = TaskButtonWrap(task)
+            urwid.connect_signal(wrap.button, "click", self.on_click, task)
+            button = urwid.AttrMap(wrap, "normal", "active-bg")
+            self._set_style(task, button)
+            self.buttons[task] = button
+        return button
+
+    def _set_style(self, task, button):
+        if task == self.current:
+            button.set_attr_map({None: "standout-fg"})
+            button.set_focus_map({None: "standout-fg"})
+        else:
+            button.set_attr_map({None: "normal"})
+            button.set_focus_map({None: "active-bg"})
+
+    def set_tasks(self, tasks, current):
+        """Show tasks in the given order, highlighting current. Keeps the cursor on the task it was on."""
+        focus_task = self.focus_task
+        self.tasks = list(tasks)
+        self.positions = {task: row for row, task in enumerate(self.tasks)}
+        previous, self.current = self.current, current
+        for task in (previous, current):
+            if task in self.buttons:
+                self._set_style(task, self.buttons[task])
+        for button in self.buttons.values():  # Durations or names may have changed
+            button.base_widget._invalidate()
+        if focus_task in self.positions:
+            self.focus = len(self.header) + self.positions[focus_task]
+        elif self.focus_task is None and self.tasks:
+            self.focus = len(self.header)
+        self._modified()
+
+    def update(self, task):
+        """Redraw the row of task, if it was shown."""
+        if task in self.buttons:
+            self.buttons[task].base_widget._invalidate()
+
+
 class NewTask(urwid.Edit):
     def __init__(self, application, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -70,13 +160,13 @@ class RecordEdit(urwid.Edit):
         self.record.end = new_end
 
         try:
-            self.application.taskmanager.check_for_overlapping()
+            self.application.taskmanager.check_for_overlapping(self.record)
         except RecordOverlap as e:
             self.record.start = old_start
             self.record.end = old_end
             self.application.set_message("Failed to edit. {}".format(str(e)), error=True)
             return
-        self.record.task.write("{}: Change record".format(self.record.task.name[:30]))
+        self.record.save(old_start, old_end)
         self.application.to_main_screen()
 
     def _clean(self, line):
@@ -97,12 +187,25 @@ class RecordEdit(urwid.Edit):
 
 
 class RecordButton(urwid.Button):
-    def __init__(self, record, application, *args, **kwargs):
+    def __init__(self, record, application, selected=False, *args, **kwargs):
         super().__init__(record.label, *args, **kwargs)
         self.record = record
         self.application = application
+        self.selected = selected
+        self.update_label()
+
+    def toggle_selected(self):
+        """Mark the record for changes made to many records at once."""
+        self.selected = not self.selected
+        self.update_label()
+
+    def update_label(self):
+        self.set_label(("standout-fg", self.record.label) if self.selected else self.record.label)
 
     def keypress(self, size, key):
+        if key == " ":
+            self.toggle_selected()
+            return
         if key == "h":
             self._move_by_timedelta("start", timedelta(minutes=1))
         if key == "j":
@@ -118,6 +221,7 @@ class RecordButton(urwid.Button):
 
     def _move_by_timedelta(self, side, my_timedelta):
         assert side in ("start", "end")
+        old_start, old_end = self.record.start, self.record.end
         old_value = getattr(self.record, side)
         setattr(self.record, side, old_value + my_timedelta)
         end = self.record.end or datetime.now().replace(microsecond=0)
@@ -126,13 +230,13 @@ class RecordButton(urwid.Button):
             self.application.set_message("Failed to edit: Start time must be before end time.", error=True)
             return
         try:
-            self.record.task.taskmanager.check_for_overlapping()
+            self.record.task.taskmanager.check_for_overlapping(self.record)
         except RecordOverlap as e:
             setattr(self.record, side, old_value)
             self.application.set_message("Failed to edit. {}".format(str(e)), error=True)
         else:
-            self.set_label(self.record.label)
-            self.record.task.write("{}: Change record".format(self.record.task.name[:30]))
+            self.update_label()
+            self.record.save(old_start, old_end)
             self.application.set_message("Edit saved.")
 
 
@@ -147,10 +251,32 @@ class RenameTask(urwid.Edit):
         new_name = self.get_edit_text()
         if new_name:
             if key == 'enter':
-                old_name = self.task.name
-                self.task.name = new_name
-                self.task.write("{}: Rename to '{}'".format(old_name, new_name))
+                other = self.task.taskmanager.tasks_by_name.get(new_name)
+                if other is not None and other is not self.task:
+                    self.application.to_main_screen()
+                    self.application.set_message("Failed to rename: A task named '{}' exists already.".format(
+                        new_name), error=True)
+                    return
+                self.task.rename(new_name)
                 self.application.to_main_screen()
         if key == 'esc':
             self.application.to_main_screen()
         super().keypress(size, key)
+
+
+class Prompt(urwid.Edit):
+    """Asks for a single value, e.g. how many minutes to shift records by. Enter passes it on, Esc cancels."""
+
+    def __init__(self, on_enter, on_cancel, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_enter = on_enter
+        self.on_cancel = on_cancel
+
+    def keypress(self, size, key):
+        if key == 'enter':
+            self.on_enter(self.get_edit_text())
+            return
+        if key == 'esc':
+            self.on_cancel()
+            return
+        return super().keypress(size, key)
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from .intervals import IntervalIndex
+from .io import CommitQueue, expand_paths, read_columns
+from .records import RecordStore
+from .tasks import TaskManager
+
+
+def _read(file_name):
+    try:
+        return read_columns(file_name)
+    except FileNotFoundError:
+        return {}
+
+
+class Workspace(object):
+    """
+    Several rata files, each with its own TaskManager. They share one record store and overlap index, so a record can't
+    overlap a record of another file either, and one commit queue which only commits the files that changed.
+    """
+
+    def __init__(self, paths, lazy=False):
+        """Open the given files, folders are replaced by the files in them. Files are read in parallel threads."""
+        self.file_names = expand_paths(paths)
+        self.lazy = lazy
+        self.store = RecordStore()
+        self.intervals = IntervalIndex(self.store)
+        self.committer = CommitQueue()
+        self.taskmanagers = []
+        with ThreadPoolExecutor() as pool:
+            columns = list(pool.map(_read, self.file_names))
+        # Only reading happens in threads, records are added to the shared store one file after the other
+        for file_name, file_columns in zip(self.file_names, columns):
+            self.taskmanagers.append(TaskManager(file_name, lazy, self, file_columns))
+        if not lazy and self.taskmanagers:
+            self.taskmanagers[0].check_for_overlapping()
+
+    def open(self, file_name):
+        """Add another file."""
+        taskmanager = TaskManager(file_name, self.lazy, self)
+        self.file_names.append(file_name)
+        self.taskmanagers.append(taskmanager)
+        if not self.lazy:
+            taskmanager.check_for_overlapping()
+        return taskmanager
+
+    def release(self, taskmanager):
+        """Stop keeping a file, committing its changes first. Its records are taken out of the shared overlap index."""
+        self.committer.flush()
+        for task in taskmanager.tasks:
+            taskmanager.replace(task, [], [])
+        self.file_names.remove(taskmanager.file_name)
+        self.taskmanagers.remove(taskmanager)
+
+    def find_running_task(self):
+        for taskmanager in self.taskmanagers:
+            task = taskmanager.find_running_task()
+            if task is not None:
+                return task
+        return None
+
+    def close(self):
+        """Commit any changes still waiting in the queue."""
+        self.committer.close()
+
+    @property
+    def total_duration(self):
+        return sum([t.total_duration for t in self.taskmanagers], timedelta())
+
+    @property
+    def todays_duration(self):
+        return self.period_duration("today")
+
+    def period_duration(self, period):
+        return sum([t.period_duration(period) for t in self.taskmanagers], timedelta())
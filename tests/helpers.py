@@ -0,0 +1,33 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+
+class RepositoryTestCase(unittest.TestCase):
+    """Runs each test in a new git repository holding an empty logbook, without a cache or a daemon."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        environment = mock.patch.dict(os.environ, {"RATA_CACHE_DIR": "", "RATA_COMMIT_DELAY": "0",
+                                                   "RATA_SOCKET": os.path.join(self.directory, "no-daemon.sock")})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.git("init", "-q")
+        self.git("config", "user.name", "rata test")
+        self.git("config", "user.email", "test@localhost")
+        self.file_name = os.path.join(self.directory, "logbook.txt")
+        open(self.file_name, "w").close()
+        self.git("add", "logbook.txt")
+        self.git("commit", "-q", "-m", "Empty logbook")
+
+    def git(self, *args):
+        return subprocess.run(["git"] + list(args), cwd=self.directory, check=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE).stdout.decode()
+
+    def read(self, file_name=None):
+        with open(file_name or self.file_name) as input_file:
+            return input_file.read()
@@ -0,0 +1,29 @@
+from datetime import date
+
+from rata.libs.archive import archive
+from rata.libs.daemon import Daemon
+
+from .helpers import RepositoryTestCase
+
+
+class ArchiveTest(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        this_year = date.today().year
+        with open(self.file_name, "w") as output:
+            output.write("* A\n:LOGBOOK:\n"
+                         "CLOCK: [{0}-01-04 09:00:00] -- [{0}-01-04 10:00:00]\n"
+                         "CLOCK: [{1}-12-04 09:00:00] -- [{1}-12-04 11:00:00]\n:END:\n".format(this_year, this_year - 1))
+        self.git("commit", "-q", "-am", "Two records")
+        archive(self.file_name, date(this_year, 1, 1))
+
+    def test_report_says_whether_archived_records_count(self):
+        daemon = Daemon([self.file_name])
+        self.addCleanup(daemon.workspace.close)
+        total = daemon.handle({"command": "report"})
+        self.assertEqual(total["files"][self.file_name], {"A": 3 * 3600})
+        self.assertTrue(total["archived_included"])
+        year = daemon.handle({"command": "report", "period": "this year"})
+        self.assertFalse(year["archived_included"])
+        self.assertEqual(daemon.workspace.taskmanagers[0].archived_seconds, 2 * 3600)
@@ -0,0 +1,58 @@
+import os
+from unittest import mock
+
+from rata.libs.cache import cache_dir, load_cache, save_cache
+from rata.libs.io import read_columns
+from rata.libs.tasks import TaskManager
+
+from .helpers import RepositoryTestCase
+
+
+class CacheTest(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        environment = mock.patch.dict(os.environ, {"RATA_CACHE_DIR": os.path.join(self.directory, "cache")})
+        environment.start()
+        self.addCleanup(environment.stop)
+        with open(self.file_name, "w") as output:
+            output.write("* A\n:LOGBOOK:\nARCHIVED: 1:00:00\n"
+                         "CLOCK: [2021-01-04 09:00:00] -- [2021-01-04 10:00:00]\n"
+                         "CLOCK: [2021-01-05 09:00:00] -- [2021-01-05 10:30:00]\n:END:\n"
+                         "* B\n:LOGBOOK:\nCLOCK: [2021-01-06 09:00:00] -- [running]\n:END:\n")
+
+    def columns(self, tasks):
+        return {name: (list(starts), list(ends)) for name, (starts, ends) in tasks.items()}
+
+    def test_round_trip(self):
+        parsed = read_columns(self.file_name)  # Saves the cache
+        self.assertTrue(os.listdir(cache_dir()))
+        cached = load_cache(self.file_name)
+        self.assertEqual(self.columns(cached), self.columns(parsed))
+        self.assertEqual(cached.archived, {"A": 3600})
+        self.assertIsInstance(cached["A"][0], memoryview)
+        taskmanager = TaskManager(self.file_name)
+        self.assertEqual(taskmanager.tasks_by_name["A"].duration.total_seconds(), 3.5 * 3600)
+        self.assertEqual(len(taskmanager.tasks_by_name["A"].record_ids), 2)
+        taskmanager.close()
+
+    def test_changed_file_invalidates(self):
+        save_cache(self.file_name, read_columns(self.file_name))
+        with open(self.file_name, "a") as output:
+            output.write("* C\n:LOGBOOK:\n:END:\n")
+        self.assertIsNone(load_cache(self.file_name))
+        self.assertIn("C", read_columns(self.file_name))
+
+    def test_same_size_and_time_but_other_content_invalidates(self):
+        save_cache(self.file_name, read_columns(self.file_name))
+        stat = os.stat(self.file_name)
+        with open(self.file_name, "r+") as output:
+            output.write("* Z")
+        os.utime(self.file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(load_cache(self.file_name))
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        with mock.patch("rata.libs.cache.os.replace", side_effect=OSError("disk full")):
+            save_cache(self.file_name, read_columns(self.file_name))
+        self.assertEqual(os.listdir(cache_dir()), [])
+        self.assertIsNone(load_cache(self.file_name))
@@ -0,0 +1,44 @@
+import asyncio
+import os
+import signal
+import socket
+import stat
+from unittest import mock
+
+from rata.libs import client
+from rata.libs.daemon import Daemon
+
+from .helpers import RepositoryTestCase
+
+
+class ClientTest(RepositoryTestCase):
+
+    def test_daemon_not_answering(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(client.socket_path())
+        listener.listen()
+        with mock.patch.object(client, "timeout", 0.2):
+            self.assertIsNone(client.request("status"))
+
+    def test_socket_only_for_the_user(self):
+        daemon = Daemon([self.file_name])
+        self.addCleanup(daemon.close)
+        path = client.socket_path()
+        umask = os.umask(0o022)
+        self.addCleanup(os.umask, umask)
+
+        async def serve():
+            served = asyncio.create_task(daemon.serve(path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            reply = await asyncio.get_running_loop().run_in_executor(None, client.request, "status")
+            os.kill(os.getpid(), signal.SIGTERM)
+            await served
+            return mode, reply
+
+        mode, reply = asyncio.run(serve())
+        self.assertEqual(mode & 0o077, 0)
+        self.assertTrue(reply["ok"])
+        self.assertEqual(os.umask(0o022), 0o022)
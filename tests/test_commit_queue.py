@@ -0,0 +1,46 @@
+from datetime import datetime
+import threading
+import time
+
+from rata.libs.io import CommitQueue, append_journal
+
+from .helpers import RepositoryTestCase
+
+
+class SlowBackend(object):
+    """Takes a while to commit and remembers how many commits ran at once."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.messages = []
+        self.running = 0
+        self.most_running = 0
+
+    def commit(self, file_name, message):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        self.started.set()
+        time.sleep(0.2)
+        self.messages.append(message)
+        self.running -= 1
+        return True
+
+    def close(self):
+        pass
+
+
+class CommitQueueTest(RepositoryTestCase):
+
+    def test_flush_waits_for_the_commit_in_progress(self):
+        backend = SlowBackend()
+        committer = CommitQueue(delay=0, backend=backend)
+        self.addCleanup(committer.close)
+        append_journal(self.file_name, ["start", "A", datetime(2021, 1, 4, 9)])
+        committer.put(self.file_name, "A: Start task")
+        self.assertTrue(backend.started.wait(5))
+        append_journal(self.file_name, ["stop", "A", datetime(2021, 1, 4, 9), datetime(2021, 1, 4, 10)])
+        committer.put(self.file_name, "A: Stop task")
+        committer.flush()
+        self.assertEqual(backend.messages, ["A: Start task", "A: Stop task"])
+        self.assertEqual(backend.most_running, 1)
+        self.assertIn("CLOCK: [2021-01-04 09:00:00] -- [2021-01-04 10:00:00]", self.read())
@@ -0,0 +1,28 @@
+import os
+
+from rata.libs.git import FastImportBackend
+
+from .helpers import RepositoryTestCase
+
+
+class FastImportTest(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = FastImportBackend()
+        self.addCleanup(self.backend.close)
+        with open(self.file_name, "w") as output:
+            output.write("* A\n:LOGBOOK:\nCLOCK: [2021-01-04 09:00:00] -- [2021-01-04 10:00:00]\n:END:\n")
+        self.assertTrue(self.backend.commit(self.file_name, "Stop task"))
+
+    def test_index_follows_commits(self):
+        self.assertEqual(self.git("status", "--porcelain"), "")
+        self.assertEqual(self.git("diff", "--cached", "--name-only"), "")
+
+    def test_commit_by_hand_keeps_records(self):
+        with open(os.path.join(self.directory, "notes.md"), "w") as output:
+            output.write("notes\n")
+        self.git("add", "notes.md")
+        self.git("commit", "-q", "-m", "Notes")
+        self.assertEqual(self.git("show", "HEAD:logbook.txt"), self.read())
+        self.assertEqual(self.git("show", "--name-only", "--format=", "HEAD"), "notes.md\n")
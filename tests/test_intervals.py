@@ -0,0 +1,77 @@
+import random
+import unittest
+
+from rata.libs.intervals import IntervalIndex
+from rata.libs.records import RUNNING, RecordStore
+
+NOW = 10000
+
+
+def overlaps(store, first, second):
+    return (min(store.end(first, NOW), store.end(second, NOW)) - max(store.starts[first], store.starts[second])) > 0
+
+
+class IntervalIndexTest(unittest.TestCase):
+    """Compares the index to checking every pair of records, on random records which often touch each other."""
+
+    def records(self, seed, count=30):
+        """A store of records placed one after the other, some of zero length, the last one maybe running."""
+        generator = random.Random(seed)
+        store = RecordStore()
+        start = 0
+        for i in range(count):
+            start += generator.choice([0, 0, 5, 20])
+            end = start + generator.choice([0, 10, 30])
+            if i == count - 1 and generator.random() < 0.5:
+                store.append(None, start, RUNNING)
+            else:
+                store.append(None, start, end)
+            start = end
+        return store, generator
+
+    def test_find_overlap(self):
+        for seed in range(200):
+            store, generator = self.records(seed)
+            index = IntervalIndex(store)
+            index.extend(range(len(store)))
+            self.assertIsNone(index.sweep(NOW))
+            changed = generator.randrange(len(store))
+            start = generator.randrange(0, store.end(len(store) - 1, NOW) + 10)
+            end = RUNNING if generator.random() < 0.2 else start + generator.choice([0, 5, 10, 40])
+            index.discard(changed)
+            store.starts[changed], store.ends[changed] = start, end
+            index.add(changed)
+            others = [other for other in range(len(store)) if other != changed and overlaps(store, changed, other)]
+            found = index.find_overlap(changed, NOW)
+            if others:
+                self.assertIn(found, others, seed)
+            else:
+                self.assertIsNone(found, seed)
+
+    def test_sweep(self):
+        for seed in range(200):
+            store, generator = self.records(seed)
+            for _ in range(generator.choice([0, 1, 2])):
+                row = generator.randrange(len(store))
+                store.starts[row] -= generator.choice([1, 10, 25])
+            index = IntervalIndex(store)
+            index.extend(range(len(store)))
+            pairs = [(a, b) for a in range(len(store)) for b in range(a + 1, len(store)) if overlaps(store, a, b)]
+            found = index.sweep(NOW)
+            if pairs:
+                self.assertIsNotNone(found, seed)
+                self.assertTrue(overlaps(store, *found), seed)
+            else:
+                self.assertIsNone(found, seed)
+
+    def test_touching_records_do_not_overlap(self):
+        store = RecordStore()
+        index = IntervalIndex(store)
+        for start, end in [(0, 10), (10, 20), (20, RUNNING)]:
+            index.add(store.append(None, start, end))
+        self.assertIsNone(index.sweep(NOW))
+        self.assertEqual([index.find_overlap(row, NOW) for row in range(3)], [None, None, None])
+        self.assertIsNone(index.sweep(20))  # The running record has no length yet
+        index.add(store.append(None, 15, 16))
+        self.assertEqual(index.find_overlap(3, NOW), 1)
+        self.assertEqual(index.sweep(NOW), (1, 3))
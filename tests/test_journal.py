@@ -0,0 +1,140 @@
+from datetime import datetime
+import os
+import stat
+import subprocess
+import sys
+import threading
+from unittest import mock
+
+from rata.libs import io
+from rata.libs.io import (append_journal, checksum, compact, file_lock, has_journal, journal_name, read_file,
+                         write_file)
+from rata.libs.tasks import TaskManager
+
+from .helpers import RepositoryTestCase
+
+
+class ReplayTest(RepositoryTestCase):
+
+    def test_start_again_within_the_second_it_stopped(self):
+        taskmanager = TaskManager(self.file_name)
+        task = taskmanager.add("A")
+        task.start()
+        task.stop()
+        task.start()
+        taskmanager.close()
+        records = read_file(self.file_name)["A"]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(sorted(end is None for _, end in records), [False, True])
+        taskmanager = TaskManager(self.file_name)
+        self.assertEqual(taskmanager.find_running_task().name, "A")
+        taskmanager.find_running_task().stop()
+        taskmanager.close()
+        self.assertNotIn("running", self.read())
+        self.assertEqual(len(read_file(self.file_name)["A"]), 2)
+
+    def test_events_before_the_checksum_of_the_file_are_skipped(self):
+        start, end = datetime(2021, 1, 4, 9), datetime(2021, 1, 4, 10)
+        with open(self.file_name, "w") as output:
+            output.write("* A\n:LOGBOOK:\nCLOCK: [2021-01-04 09:00:00] -- [2021-01-04 10:00:00]\n:END:\n")
+        append_journal(self.file_name, ["start", "A", start])
+        append_journal(self.file_name, ["stop", "A", start, end])
+        append_journal(self.file_name, ["folded", "0" * 40])  # Of a file that never replaced this one
+        append_journal(self.file_name, ["add", "A", end, datetime(2021, 1, 4, 11)])
+        self.assertEqual(len(read_file(self.file_name)["A"]), 3)  # The first record twice, the file doesn't match
+        append_journal(self.file_name, ["folded", checksum(self.file_name)])
+        append_journal(self.file_name, ["start", "B", end])
+        self.assertEqual(read_file(self.file_name), {"A": [[start, end]], "B": [[end, None]]})
+
+
+class CompactTest(RepositoryTestCase):
+    start, end, earlier = datetime(2021, 1, 4, 9), datetime(2021, 1, 4, 10), datetime(2021, 1, 4, 8)
+
+    def setUp(self):
+        super().setUp()
+        append_journal(self.file_name, ["start", "A", self.start])
+        append_journal(self.file_name, ["stop", "A", self.start, self.end])
+        append_journal(self.file_name, ["edit", "A", self.start, self.end, self.earlier, self.end])
+
+    def test_crash_after_replacing_the_file(self):
+        with mock.patch("rata.libs.io.os.unlink", side_effect=OSError("crashed")):
+            self.assertRaises(OSError, compact, self.file_name)
+        self.assertTrue(has_journal(self.file_name))
+        self.assertEqual(read_file(self.file_name), {"A": [[self.earlier, self.end]]})
+        append_journal(self.file_name, ["start", "B", self.end])
+        compact(self.file_name)
+        self.assertEqual(read_file(self.file_name), {"A": [[self.earlier, self.end]], "B": [[self.end, None]]})
+        self.assertFalse(has_journal(self.file_name))
+
+    def test_crash_before_replacing_the_file(self):
+        replace = os.replace
+
+        def crash_on_the_file(source, target):
+            if target == self.file_name:
+                raise OSError("crashed")
+            replace(source, target)
+
+        with mock.patch("rata.libs.io.os.replace", side_effect=crash_on_the_file):
+            self.assertRaises(OSError, compact, self.file_name)
+        self.assertEqual(self.read(), "")
+        self.assertEqual(read_file(self.file_name), {"A": [[self.earlier, self.end]]})
+        compact(self.file_name)
+        self.assertEqual(read_file(self.file_name), {"A": [[self.earlier, self.end]]})
+        taskmanager = TaskManager(self.file_name)
+        taskmanager.add("A").start()  # Would overlap a duplicate record
+        taskmanager.close()
+
+    def test_append_while_compacting(self):
+        write_file = io.write_file
+        appended = []
+
+        def append_meanwhile(*args, **kwargs):
+            thread = threading.Thread(target=lambda: appended.append(
+                append_journal(self.file_name, ["start", "B", self.end])))
+            thread.start()
+            thread.join(5)
+            return write_file(*args, **kwargs)
+
+        with mock.patch("rata.libs.io.write_file", side_effect=append_meanwhile):
+            compact(self.file_name)
+        self.assertEqual(appended, [None])
+        self.assertNotIn("* B", self.read())
+        self.assertTrue(os.path.exists(journal_name(self.file_name)))
+        self.assertEqual(read_file(self.file_name), {"A": [[self.earlier, self.end]], "B": [[self.end, None]]})
+
+
+class LockTest(RepositoryTestCase):
+
+    def test_lock_held_by_another_process(self):
+        holder = subprocess.Popen([sys.executable, "-c", "import sys\nfrom rata.libs.io import file_lock\n"
+                                   "with file_lock(sys.argv[1], 'journal'):\n print(flush=True)\n sys.stdin.read()",
+                                   self.file_name], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.addCleanup(holder.wait)
+        with holder.stdin:
+            holder.stdout.readline()
+            holder.stdout.close()
+            with file_lock(self.file_name, "journal", wait=False) as locked:
+                self.assertFalse(locked)
+            with file_lock(self.file_name, "compact", wait=False) as locked:
+                self.assertTrue(locked)
+        with file_lock(self.file_name, "journal") as locked:
+            self.assertTrue(locked)
+
+
+class WriteFileTest(RepositoryTestCase):
+    tasks = {"A": [[datetime(2021, 1, 4, 9), datetime(2021, 1, 4, 10)]]}
+
+    def mode(self, file_name):
+        return stat.S_IMODE(os.stat(file_name).st_mode)
+
+    def test_new_file_follows_the_umask(self):
+        new_file = os.path.join(self.directory, "new.txt")
+        with mock.patch.object(io, "_umask", 0o077):
+            write_file(self.tasks, new_file)
+        self.assertEqual(self.mode(new_file), 0o600)
+
+    def test_replaced_file_keeps_its_mode(self):
+        os.chmod(self.file_name, 0o640)
+        with mock.patch.object(io, "_umask", 0o077):
+            write_file(self.tasks, self.file_name)
+        self.assertEqual(self.mode(self.file_name), 0o640)
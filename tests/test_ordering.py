@@ -0,0 +1,41 @@
+from rata.libs.tasks import TaskManager, sort_keys
+
+from .helpers import RepositoryTestCase
+
+
+class TaskOrderTest(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open(self.file_name, "w") as output:
+            output.write("* b\n:LOGBOOK:\nCLOCK: [2021-01-04 09:00:00] -- [2021-01-04 12:00:00]\n:END:\n"
+                         "* A\n:LOGBOOK:\nCLOCK: [2021-01-04 13:00:00] -- [2021-01-04 14:00:00]\n:END:\n"
+                         "* c\n:LOGBOOK:\nCLOCK: [2021-01-04 17:00:00] -- [2021-01-04 19:00:00]\n:END:\n"
+                         "* D\n:LOGBOOK:\n:END:\n")
+        self.taskmanager = TaskManager(self.file_name)
+        self.addCleanup(self.taskmanager.close)
+
+    def assertSorted(self):
+        for sort_order, key in sort_keys.items():
+            self.assertEqual([t.name for t in self.taskmanager.tasks_by(sort_order)],
+                             [t.name for t in sorted(self.taskmanager.tasks, key=key)], sort_order)
+
+    def test_orders_follow_changes(self):
+        self.assertSorted()
+        tasks = self.taskmanager.tasks_by_name
+        tasks["A"].start()
+        self.assertEqual(self.taskmanager.tasks_by("most recent")[0].name, "A")
+        self.assertSorted()
+        tasks["A"].stop()
+        self.assertSorted()
+        tasks["c"].rename("0 first")
+        self.assertEqual(self.taskmanager.tasks_by("name")[0].name, "0 first")
+        self.assertSorted()
+        self.taskmanager.untrack(tasks["b"].record_ids[0])
+        self.assertEqual(self.taskmanager.tasks_by("duration")[0].name, "0 first")
+        self.assertSorted()
+        self.taskmanager.remove(tasks["b"])
+        self.assertNotIn("b", [t.name for t in self.taskmanager.tasks_by("name")])
+        self.assertSorted()
+        self.taskmanager.close()
+        self.assertEqual(self.taskmanager.committer.failed, 0)
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+import unittest
+
+from rata.libs.records import EPOCH_ORDINAL, RUNNING, to_epoch
+from rata.libs.rollup import DayRollup, period_range
+
+
+def day(*args):
+    return date(*args).toordinal() - EPOCH_ORDINAL
+
+
+class DayRollupTest(unittest.TestCase):
+
+    def test_record_crossing_midnight_is_split(self):
+        rollup = DayRollup()
+        rollup.add(to_epoch(datetime(2021, 1, 4, 22)), to_epoch(datetime(2021, 1, 6, 1, 30)))
+        self.assertEqual(rollup.between(day(2021, 1, 4), day(2021, 1, 4)), 2 * 3600)
+        self.assertEqual(rollup.between(day(2021, 1, 5), day(2021, 1, 5)), 24 * 3600)
+        self.assertEqual(rollup.between(day(2021, 1, 6), day(2021, 1, 6)), 1.5 * 3600)
+        self.assertEqual(rollup.between(day(2021, 1, 1), day(2021, 1, 31)), 27.5 * 3600)
+        self.assertEqual(rollup.between(day(2021, 1, 7), day(2021, 1, 31)), 0)
+
+    def test_record_ending_at_midnight_stays_on_its_day(self):
+        rollup = DayRollup()
+        rollup.extend([to_epoch(datetime(2021, 1, 4, 23))], [to_epoch(datetime(2021, 1, 5))])
+        self.assertEqual(dict(rollup.seconds), {day(2021, 1, 4): 3600})
+
+    def test_daylight_saving_time_changes_nothing(self):
+        """Times are naive wall clock times, so the night the clocks change has as many hours as it shows."""
+        rollup = DayRollup()
+        spring = [datetime(2021, 3, 27, 23), datetime(2021, 3, 28, 3)]
+        autumn = [datetime(2021, 10, 30, 23), datetime(2021, 10, 31, 3)]
+        rollup.extend([to_epoch(spring[0]), to_epoch(autumn[0])], [to_epoch(spring[1]), to_epoch(autumn[1])])
+        self.assertEqual(rollup.between(*period_range("this week", date(2021, 3, 27))), 4 * 3600)
+        self.assertEqual(rollup.between(day(2021, 3, 27), day(2021, 3, 27)), 3600)
+        self.assertEqual(rollup.between(day(2021, 3, 28), day(2021, 3, 28)), 3 * 3600)
+        self.assertEqual(rollup.between(*period_range("this month", date(2021, 10, 1))), 4 * 3600)
+        self.assertEqual(rollup.between(*period_range("this year", date(2021, 1, 1))), 8 * 3600)
+
+    def test_running_records_are_skipped(self):
+        rollup = DayRollup()
+        rollup.extend([to_epoch(datetime(2021, 1, 4, 9))], [RUNNING])
+        self.assertEqual(rollup.between(day(2021, 1, 1), day(2021, 1, 31)), 0)
+
+    def test_removing_and_merging(self):
+        rollup, other = DayRollup(), DayRollup()
+        other.add(to_epoch(datetime(2021, 1, 4, 23)), to_epoch(datetime(2021, 1, 5, 1)))
+        rollup.merge(other)
+        self.assertEqual(rollup.between(day(2021, 1, 5), day(2021, 1, 5)), 3600)
+        rollup.merge(other, -1)
+        self.assertEqual(rollup.between(day(2021, 1, 1), day(2021, 1, 31)), 0)
@@ -0,0 +1,27 @@
+from rata.libs import summary
+from rata.libs.daemon import Daemon
+from rata.libs.io import read_file
+
+from .helpers import RepositoryTestCase
+
+
+class SwitchTest(RepositoryTestCase):
+
+    def assertSwitchKeepsRecord(self, handle):
+        reply = handle("start", "A")
+        self.assertTrue(reply["ok"], reply)
+        since = reply["running"]["since"]
+        reply = handle("switch", "A")
+        self.assertTrue(reply["ok"], reply)
+        self.assertEqual((reply["running"]["task"], reply["running"]["since"]), ("A", since))
+        self.assertEqual(len(read_file(self.file_name)["A"]), 1)
+        reply = handle("switch", "B")
+        self.assertEqual(reply["running"]["task"], "B")
+
+    def test_daemon(self):
+        daemon = Daemon([self.file_name])
+        self.addCleanup(daemon.workspace.close)
+        self.assertSwitchKeepsRecord(lambda command, task: daemon.handle({"command": command, "task": task}))
+
+    def test_without_daemon(self):
+        self.assertSwitchKeepsRecord(lambda command, task: summary.handle(command, self.file_name, task))
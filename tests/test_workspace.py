@@ -0,0 +1,27 @@
+from rata.libs.workspace import Workspace
+
+from .helpers import RepositoryTestCase
+
+
+class WorkspaceTest(RepositoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open(self.file_name, "w") as output:
+            output.write("* A\n:LOGBOOK:\n"
+                         "CLOCK: [2021-01-04 09:00:00] -- [2021-01-04 10:00:00]\n"
+                         "CLOCK: [2021-01-05 09:00:00] -- [2021-01-05 10:00:00]\n"
+                         "CLOCK: [2021-01-06 09:00:00] -- [2021-01-06 10:00:00]\n:END:\n")
+        self.workspace = Workspace([self.file_name])
+        self.addCleanup(self.workspace.close)
+
+    def test_release_and_open_reuse_rows(self):
+        for _ in range(5):
+            self.workspace.release(self.workspace.taskmanagers[0])
+            self.assertEqual(len(self.workspace.store), 0)
+            taskmanager = self.workspace.open(self.file_name)
+            self.assertEqual(len(self.workspace.store.starts), 3)
+            self.assertEqual(len(self.workspace.intervals), 3)
+        self.assertEqual({task.name for task in self.workspace.store.tasks}, {"A"})
+        self.assertIs(self.workspace.store.tasks[0], taskmanager.tasks_by_name["A"])
+        self.assertEqual(taskmanager.total_duration.total_seconds(), 3 * 3600)